@@ -0,0 +1,75 @@
+# Memory, dispatch and run-state time on a generated config with 10k commands, run with `uv run python benchmarks/config_scale.py`
+import copy
+import gc
+import time
+import tracemalloc
+
+from fonk.config import Config
+from fonk.runner import command_mods_stages
+from fonk.session import gather_commands_deduped
+from fonk.state import RunState
+
+COMMANDS = 10_000
+FLAGS = 10
+ALIASES = 100
+RUNNABLES = ["all", "a5", "c7"]
+
+
+def generate() -> dict:
+    commands = {}
+
+    for index in range(COMMANDS):
+        flags: list[dict] = [{"on": f"f{(index + k) % FLAGS}", "add": f"--x{k}"} for k in range(3)]
+        flags[0]["remove"] = "--check"
+        flags.append({"on": "quiet", "add": "-q"})
+        commands[f"c{index}"] = {"type": "shell", "arguments": ["echo", str(index), "--check"], "flags": flags}
+
+    size = COMMANDS // ALIASES
+    aliases = {
+        f"a{j}": {"commands": [f"c{i}" for i in range(j * size, (j + 1) * size)], "flags": [f"f{j % FLAGS}"]}
+        for j in range(ALIASES)
+    }
+    aliases["all"] = {"commands": [f"a{j}" for j in range(ALIASES)], "flags": ["f1"]}
+
+    return {"flags": [{"name": f"f{i}"} for i in range(FLAGS)], "command": commands, "alias": aliases}
+
+
+def main() -> None:
+    data = generate()
+
+    gc.collect()
+    tracemalloc.start()
+    loaded = copy.deepcopy(data)
+    config = Config.from_dict("bench", loaded)
+    del loaded
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    active = {flag for flag in config.flags if flag.name in ("f3", "quiet")}
+    best = float("inf")
+
+    for _ in range(3):
+        start = time.perf_counter()
+        gathered = gather_commands_deduped(config, RUNNABLES, active)
+        for command, mods in gathered:
+            command_mods_stages(command, mods)
+        best = min(best, time.perf_counter() - start)
+
+    state_best = float("inf")
+
+    for _ in range(3):
+        start = time.perf_counter()
+        state = RunState(runnables=RUNNABLES)
+        for index, (command, mods) in enumerate(gathered):
+            state.record(command, mods, index % 2)
+        resumed = sum(state.has_succeeded(command, mods) for command, mods in gathered)
+        state_best = min(state_best, time.perf_counter() - start)
+
+    print(f"retained config memory: {memory / 1e6:.2f} MB")
+    print(f"gather + dispatch time: {best * 1000:.1f} ms for {len(gathered)} runs of {' '.join(RUNNABLES)}")
+    print(f"run state time: {state_best * 1000:.1f} ms to record {len(gathered)} runs and skip {resumed} on resume")
+
+
+if __name__ == "__main__":
+    main()
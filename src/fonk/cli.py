@@ -1,26 +1,91 @@
 import asyncio
 import sys
+import time
 
 import rich
 
-from fonk.cli_parser import parse_args
+from fonk.cli_parser import parse_args, wants_workspace
+from fonk.completion import SHELLS, completion_script
 from fonk.config import (
+    FLAG_COMPLETION,
     FLAG_CONCURRENT,
+    FLAG_DEADLINE,
     FLAG_FAIL_QUICK,
+    FLAG_FAILED,
     FLAG_HELP,
+    FLAG_PIN_CPUS,
     FLAG_QUIET,
+    FLAG_RESERVE_CPUS,
+    FLAG_RESUME,
     FLAG_VERBOSE,
+    FLAG_WORKERS,
+    FLAG_WORKSPACE,
     Config,
     Flag,
+    Option,
     OptionInstance,
     get_config,
 )
 from fonk.errors import FonkCommandError, FonkConfigurationError
 from fonk.render import render_help, render_help_command
-from fonk.session import Session
+from fonk.runner import CpuPool
+from fonk.session import Session, WorkspaceSession
+from fonk.state import RunState, load_state, session_flags
+from fonk.workspace import load_members
 
+# Run state and fail-quick are tracked per project, a workspace run does not carry them across members,
+# and workers serve the single project they were started in
+WORKSPACE_UNSUPPORTED = (FLAG_FAILED, FLAG_RESUME, FLAG_FAIL_QUICK, FLAG_WORKERS)
 
-def run(config: Config, flags: set[Flag | OptionInstance], runnables: list[str]) -> None:
+
+def _option(flags: set[Flag | OptionInstance], option: Option) -> OptionInstance | None:
+    return next((flag for flag in flags if isinstance(flag, OptionInstance) and flag.name == option.name), None)
+
+
+def _deadline(flags: set[Flag | OptionInstance]) -> float | None:
+    deadline_flag = _option(flags, FLAG_DEADLINE)
+
+    if deadline_flag is None or not isinstance(deadline_flag.value, float):
+        return None
+
+    if not deadline_flag.value > 0:
+        raise FonkCommandError(f"Deadline must be a positive number of seconds, not {deadline_flag.value:g}")
+
+    return time.monotonic() + deadline_flag.value
+
+
+def _cpu_pool(flags: set[Flag | OptionInstance]) -> CpuPool | None:
+    reserve_flag = _option(flags, FLAG_RESERVE_CPUS)
+    reserved = reserve_flag.value if reserve_flag and isinstance(reserve_flag.value, int) else 0
+
+    if FLAG_PIN_CPUS not in flags and reserve_flag is None:
+        return None
+
+    if reserved < 0:
+        raise FonkCommandError(f"Cannot reserve a negative number of CPUs: {reserved}")
+
+    return CpuPool(reserved, pin=FLAG_PIN_CPUS in flags)
+
+
+def _previous_run(config: Config, flags: set[Flag | OptionInstance], runnables: list[str]) -> RunState | None:
+    if FLAG_FAILED not in flags and FLAG_RESUME not in flags:
+        return None
+
+    previous = load_state(config.root)
+
+    if previous is None or previous.runnables != runnables:
+        raise FonkCommandError(f"No previous run of {' '.join(runnables)} recorded")
+
+    if previous.flags != (current := session_flags(config, flags)):
+        raise FonkCommandError(
+            f"The previous run of {' '.join(runnables)} used different flags "
+            f"({', '.join(previous.flags) or 'none'} instead of {', '.join(current) or 'none'})"
+        )
+
+    return previous
+
+
+def _run_informational(config: Config, flags: set[Flag | OptionInstance], runnables: list[str]) -> bool:
     if FLAG_HELP in flags:
         if runnables:
             for runnable in runnables:
@@ -28,6 +93,20 @@ def run(config: Config, flags: set[Flag | OptionInstance], runnables: list[str])
         else:
             render_help(config)
 
+        return True
+
+    if completion_flag := _option(flags, FLAG_COMPLETION):
+        if completion_flag.value not in SHELLS:
+            raise FonkCommandError(f"Unsupported shell for completion: {completion_flag.value}")
+
+        print(completion_script(str(completion_flag.value)), end="")
+        return True
+
+    return False
+
+
+def run(config: Config, flags: set[Flag | OptionInstance], runnables: list[str]) -> None:
+    if _run_informational(config, flags, runnables):
         return
 
     if not runnables:
@@ -39,36 +118,80 @@ def run(config: Config, flags: set[Flag | OptionInstance], runnables: list[str])
         runnables.append(default.command)
         flags.update({flag for flag in config.flags if flag.name in default.flags})
 
+    concurrent_flag = _option(flags, FLAG_CONCURRENT)
+    jobs = concurrent_flag.value if concurrent_flag else None
+    limit = jobs if isinstance(jobs, int) and jobs > 0 else None
+
+    if FLAG_WORKSPACE in flags:
+        run_workspace(config, flags, runnables, limit)
+        return
+
     session = Session(
         config,
         FLAG_QUIET in flags,
         FLAG_VERBOSE in flags,
         FLAG_FAIL_QUICK in flags,
+        previous=_previous_run(config, flags, runnables),
+        only_failed=FLAG_FAILED in flags,
+        deadline=_deadline(flags),
+        cpu_pool=_cpu_pool(flags),
     )
 
-    concurrent_flag: OptionInstance | None = next(
-        (flag for flag in flags if flag.name == FLAG_CONCURRENT.name),  # type: ignore
-        None,
+    workers_flag = _option(flags, FLAG_WORKERS)
+    workers = (
+        [worker.strip() for worker in str(workers_flag.value).split(",") if worker.strip()] if workers_flag else []
     )
 
-    if concurrent_flag:
-        asyncio.run(
-            session.run_runnables_concurrently(
-                runnables,
-                flags,
-                concurrent_flag.value if isinstance(concurrent_flag.value, int) and concurrent_flag.value > 0 else None,
+    try:
+        if concurrent_flag or workers:
+            asyncio.run(
+                session.run_runnables_concurrently(
+                    runnables,
+                    flags,
+                    limit,
+                    workers,
+                )
             )
-        )
-    else:
-        session.run_runnables(runnables, flags)
+        else:
+            session.run_runnables(runnables, flags)
+    except KeyboardInterrupt:
+        session.save_state()
+        rich.print("💥[bold red] Interrupted, continue with --resume")
+        sys.exit(130)
+
+    session.exit()
+
+
+def run_workspace(config: Config, flags: set[Flag | OptionInstance], runnables: list[str], limit: int | None) -> None:
+    active = {flag.name for flag in flags}
+
+    if unsupported := [f"--{flag.name}" for flag in WORKSPACE_UNSUPPORTED if flag.name in active]:
+        raise FonkCommandError(f"{', '.join(unsupported)} cannot be combined with --workspace")
+
+    session = WorkspaceSession(
+        load_members(config), FLAG_QUIET in flags, FLAG_VERBOSE in flags, _deadline(flags), _cpu_pool(flags)
+    )
+
+    try:
+        asyncio.run(session.run_runnables_concurrently(runnables, flags, limit))
+    except KeyboardInterrupt:
+        rich.print("💥[bold red] Interrupted")
+        sys.exit(130)
 
     session.exit()
 
 
+def _member_flags(config: Config, args: list[str]) -> list[Flag]:
+    if not wants_workspace(config, args):
+        return []
+
+    return [flag for _, member in load_members(config).values() for flag in member.flags]
+
+
 def app() -> None:
     try:
         config = get_config()
-        flags, runnables = parse_args(config, sys.argv[1:])
+        flags, runnables = parse_args(config, sys.argv[1:], _member_flags(config, sys.argv[1:]))
         run(config, flags, runnables)
     except FonkConfigurationError as e:
         rich.print(f"💥[bold red] Your configuration is invalid: {e}")
@@ -1,7 +1,9 @@
 from argparse import ArgumentParser
+from collections.abc import Iterable
+from dataclasses import replace
 from pathlib import Path
 
-from fonk.config import Config, Flag, Option, OptionInstance
+from fonk.config import FLAG_WORKSPACE, Config, Flag, Option, OptionInstance
 
 _ARGPARSE_TYPES = {
     "str": str,
@@ -13,10 +15,29 @@ _ARGPARSE_TYPES = {
 }
 
 
-def _parser_from_config(config: Config) -> ArgumentParser:
+def _merge_flags(config: Config, extra: Iterable[Flag]) -> list[Flag]:
+    # Flags declared at the root win, other flags are added on their first declaration without a clashing shorthand
+    flags = list(config.flags)
+    names = {flag.name for flag in flags}
+    shorthands = {flag.shorthand for flag in flags if flag.shorthand}
+
+    for flag in extra:
+        if flag.name in names:
+            continue
+
+        merged = replace(flag, shorthand=None) if flag.shorthand in shorthands else flag
+        flags.append(merged)
+        names.add(merged.name)
+        if merged.shorthand:
+            shorthands.add(merged.shorthand)
+
+    return flags
+
+
+def _parser_from_flags(flags: Iterable[Flag]) -> ArgumentParser:
     parser = ArgumentParser(add_help=False, allow_abbrev=False)
 
-    for flag in config.flags:
+    for flag in flags:
         name = flag.name
         shorthand = flag.shorthand
         args = [f"--{name}"]
@@ -51,14 +72,23 @@ def _parser_from_config(config: Config) -> ArgumentParser:
     return parser
 
 
-def parse_args(config: Config, args: list[str]) -> tuple[set[Flag | OptionInstance], list[str]]:
-    parser = _parser_from_config(config)
+def wants_workspace(config: Config, args: list[str]) -> bool:
+    # Flags only declared by workspace members are unknown here, so they are left for parse_args
+    parsed, _ = _parser_from_flags(config.flags).parse_known_args(args)
+    return bool(getattr(parsed, FLAG_WORKSPACE.name))
+
+
+def parse_args(
+    config: Config, args: list[str], extra: Iterable[Flag] = ()
+) -> tuple[set[Flag | OptionInstance], list[str]]:
+    known = _merge_flags(config, extra)
+    parser = _parser_from_flags(known)
     parsed = parser.parse_args(args)
 
     flags: set[Flag | OptionInstance] = set()
     runnables: list[str] = parsed.runnables
 
-    for flag in config.flags:
+    for flag in known:
         if isinstance(flag, Option):
             if getattr(parsed, flag.name.replace("-", "_"), None) is not None:
                 flags.add(
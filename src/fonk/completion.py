@@ -0,0 +1,160 @@
+# Runs on every key press: keep imports to the standard library, the config is only loaded to rebuild the index
+import json
+import sys
+from pathlib import Path
+
+from fonk.locator import STATE_DIRECTORY, get_pyproject
+
+COMPLETION_INDEX_FILE = "completion.json"
+COMPLETION_INDEX_VERSION = 1
+SHELLS = ("bash", "zsh", "fish")
+
+_BASH_SCRIPT = """\
+_fonk_complete() {
+    local cur="${COMP_WORDS[COMP_CWORD]}" prev="${COMP_WORDS[COMP_CWORD-1]}"
+    local IFS=$'\\n'
+    local candidates=($(%(python)s -m fonk.completion bash "$cur" "$prev" 2>/dev/null))
+    case "${candidates[0]}" in
+        __file__) compopt -o filenames; COMPREPLY=($(compgen -f -- "$cur")) ;;
+        __directory__) compopt -o filenames; COMPREPLY=($(compgen -d -- "$cur")) ;;
+        *) COMPREPLY=("${candidates[@]}") ;;
+    esac
+}
+complete -F _fonk_complete fonk
+"""
+
+_ZSH_SCRIPT = """\
+_fonk() {
+    local -a candidates
+    candidates=("${(@f)$(%(python)s -m fonk.completion zsh "${words[CURRENT]}" "${words[CURRENT-1]}" 2>/dev/null)}")
+    case "${candidates[1]}" in
+        __file__) _files ;;
+        __directory__) _files -/ ;;
+        *) _describe 'fonk' candidates ;;
+    esac
+}
+compdef _fonk fonk
+"""
+
+_FISH_SCRIPT = """\
+function __fonk_complete
+    set -l tokens (commandline -opc)
+    set -l candidates (%(python)s -m fonk.completion fish (commandline -ct) $tokens[-1] 2>/dev/null)
+    switch "$candidates[1]"
+        case __file__
+            __fish_complete_path (commandline -ct)
+        case __directory__
+            __fish_complete_directories (commandline -ct)
+        case '*'
+            printf '%%s\\n' $candidates
+    end
+end
+complete -c fonk -f -a '(__fonk_complete)'
+"""
+
+_SCRIPTS = {"bash": _BASH_SCRIPT, "zsh": _ZSH_SCRIPT, "fish": _FISH_SCRIPT}
+
+
+def completion_script(shell: str) -> str:
+    return _SCRIPTS[shell] % {"python": f"'{sys.executable}'"}
+
+
+def _pyproject_stamp(pyproject: Path) -> list[int]:
+    stat = pyproject.stat()
+    return [COMPLETION_INDEX_VERSION, stat.st_mtime_ns, stat.st_size]
+
+
+def build_index(pyproject: Path) -> dict:
+    from fonk.config import Option, get_config  # noqa: PLC0415
+
+    config = get_config(pyproject.parent)
+
+    return {
+        "stamp": _pyproject_stamp(pyproject),
+        "commands": {name: command.description or "" for name, command in config.commands.items()},
+        "aliases": {name: alias.description or "" for name, alias in config.aliases.items()},
+        "flags": [
+            {
+                "name": flag.name,
+                "shorthand": flag.shorthand,
+                "description": flag.description or "",
+                "type": flag.type if isinstance(flag, Option) else None,
+            }
+            for flag in config.flags
+        ],
+    }
+
+
+def load_index(pyproject: Path) -> dict:
+    path = pyproject.parent / STATE_DIRECTORY / COMPLETION_INDEX_FILE
+
+    try:
+        with path.open("r") as file:
+            index = json.load(file)
+        if index.get("stamp") == _pyproject_stamp(pyproject):
+            return index
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    index = build_index(pyproject)
+
+    try:
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(json.dumps(index))
+    except OSError:
+        pass
+
+    return index
+
+
+def _format(shell: str, candidate: str, description: str) -> str:
+    if shell == "zsh":
+        return candidate.replace(":", "\\:") + (f":{description}" if description else "")
+    if shell == "fish":
+        return candidate + (f"\t{description}" if description else "")
+    return candidate
+
+
+def complete(index: dict, shell: str, current: str, previous: str) -> list[str]:
+    for flag in index["flags"]:
+        names = (f"--{flag['name']}", f"-{flag['shorthand']}") if flag["shorthand"] else (f"--{flag['name']}",)
+        if previous in names and flag["type"] in ("file", "directory"):
+            return [f"__{flag['type']}__"]
+
+    candidates: list[tuple[str, str]] = []
+
+    if current.startswith("-"):
+        for flag in index["flags"]:
+            candidates.append((f"--{flag['name']}", flag["description"]))
+            if flag["shorthand"]:
+                candidates.append((f"-{flag['shorthand']}", flag["description"]))
+    else:
+        candidates.extend(index["commands"].items())
+        candidates.extend(index["aliases"].items())
+
+    return [
+        _format(shell, candidate, description) for candidate, description in candidates if candidate.startswith(current)
+    ]
+
+
+def main(args: list[str]) -> int:
+    if not args or args[0] not in SHELLS:
+        return 2
+
+    shell, current, previous = (*args, "", "")[:3]
+
+    try:
+        index = load_index(get_pyproject())
+        candidates = complete(index, shell, current, previous)
+    except Exception:
+        # Completion should never print a traceback into the user's prompt
+        return 1
+
+    if candidates:
+        print("\n".join(candidates))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,9 @@
-from dataclasses import dataclass
+import functools
+import sys
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass, field
 from pathlib import Path
+from types import MappingProxyType
 from typing import Literal, Self
 
 from tomli import load
@@ -8,28 +12,98 @@ from fonk.errors import FonkConfigurationError
 from fonk.locator import get_pyproject
 
 
-@dataclass(kw_only=True)
+def _interned(value: str | list[str] | None) -> str | tuple[str, ...] | None:
+    if isinstance(value, list):
+        return tuple(sys.intern(item) for item in value)
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
 class ApplyFlag:
     on: str
-    add: str | list[str] | None = None
-    remove: str | list[str] | None = None
+    add: str | tuple[str, ...] | None = None
+    remove: str | tuple[str, ...] | None = None
+    stage: int | None = None
 
     @classmethod
     def from_dict(cls, data: dict) -> Self:
-        return cls(
-            on=data["on"],
-            add=data.get("add"),
-            remove=data.get("remove"),
+        apply_flag = cls(
+            on=sys.intern(data["on"]),
+            add=_interned(data.get("add")),
+            remove=_interned(data.get("remove")),
+            stage=data.get("stage"),
         )
+        return _intern_apply_flag(apply_flag)  # type: ignore
+
+
+# Generated configs repeat the same flag rules across many commands, so equal
+# instances (and the per-command flag indexes built from them) are shared.
+@functools.cache
+def _intern_apply_flag(apply_flag: ApplyFlag) -> ApplyFlag:
+    return apply_flag
+
+
+@functools.cache
+def _flag_index(flags: tuple[ApplyFlag, ...]) -> Mapping[str, tuple[ApplyFlag, ...]]:
+    flag_index: dict[str, tuple[ApplyFlag, ...]] = {}
+
+    for apply_flag in flags:
+        flag_index[apply_flag.on] = (*flag_index.get(apply_flag.on, ()), apply_flag)
 
+    # Shared between every command with equal flags, so it must not be mutable
+    return MappingProxyType(flag_index)
 
-@dataclass(kw_only=True)
+
+def _interned_stages(name: str, stages: object) -> tuple[tuple[str, ...], ...]:
+    if not isinstance(stages, list) or not all(
+        isinstance(stage, list) and stage and all(isinstance(argument, str) for argument in stage) for stage in stages
+    ):
+        raise FonkConfigurationError(f"Stages of {name} must be non-empty lists of string arguments")
+
+    return tuple(tuple(sys.intern(argument) for argument in stage) for stage in stages)
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
 class Command:
     name: str
     description: str | None = None
-    type: Literal["shell", "python", "uv", "uvx"]
-    arguments: list[str]
-    flags: list[ApplyFlag]
+    type: Literal["shell", "python", "uv", "uvx", "pipeline"]
+    arguments: tuple[str, ...]
+    stages: tuple[tuple[str, ...], ...] = ()
+    flags: tuple[ApplyFlag, ...]
+    timeout: float | None = None
+    priority: int | None = None
+    parallelism: int | None = None
+    flag_index: Mapping[str, tuple[ApplyFlag, ...]] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.timeout is not None and (
+            not isinstance(self.timeout, int | float) or isinstance(self.timeout, bool) or self.timeout <= 0
+        ):
+            raise FonkConfigurationError(f"Timeout of {self.name} must be a positive number of seconds")
+
+        if self.priority is not None and (
+            not isinstance(self.priority, int) or isinstance(self.priority, bool) or not -20 <= self.priority <= 19
+        ):
+            raise FonkConfigurationError(f"Priority of {self.name} must be a nice level between -20 and 19")
+
+        if self.parallelism is not None and (
+            not isinstance(self.parallelism, int) or isinstance(self.parallelism, bool) or self.parallelism < 1
+        ):
+            raise FonkConfigurationError(f"Parallelism of {self.name} must be a positive number of CPUs")
+
+        if self.type == "pipeline":
+            if not self.stages or not all(self.stages):
+                raise FonkConfigurationError(f"Pipeline {self.name} needs stages that are non-empty argument lists")
+
+            for apply_flag in self.flags:
+                stage = apply_flag.stage
+                if not isinstance(stage, int) or isinstance(stage, bool) or not 0 <= stage < len(self.stages):
+                    raise FonkConfigurationError(f"Flag {apply_flag.on} of pipeline {self.name} needs a valid stage")
+        elif self.stages or any(apply_flag.stage is not None for apply_flag in self.flags):
+            raise FonkConfigurationError(f"Stages can only be used in pipeline commands, not in {self.name}")
+
+        object.__setattr__(self, "flag_index", _flag_index(self.flags))
 
     @classmethod
     def from_dict(cls, name: str, data: dict) -> Self:
@@ -37,27 +111,31 @@ class Command:
             name=name,
             description=data.get("description"),
             type=data["type"],
-            arguments=data.get("arguments", []),
-            flags=[ApplyFlag.from_dict(flag) for flag in data.get("flags", [])],
+            arguments=tuple(sys.intern(argument) for argument in data.get("arguments", [])),
+            stages=_interned_stages(name, data.get("stages", [])),
+            flags=tuple(ApplyFlag.from_dict(flag) for flag in data.get("flags", [])),
+            timeout=data.get("timeout"),
+            priority=data.get("priority"),
+            parallelism=data.get("parallelism"),
         )
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True, slots=True)
 class Alias:
-    commands: list[str]
-    flags: list[str]
+    commands: tuple[str, ...]
+    flags: tuple[str, ...]
     description: str | None = None
 
     @classmethod
     def from_dict(cls, data: dict) -> Self:
         return cls(
-            commands=data.get("commands", []),
-            flags=data.get("flags", []),
+            commands=tuple(data.get("commands", [])),
+            flags=tuple(data.get("flags", [])),
             description=data.get("description"),
         )
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True, slots=True)
 class Flag:
     name: str
     shorthand: str | None = None
@@ -80,7 +158,7 @@ class Flag:
         )
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True, slots=True)
 class Option(Flag):
     type: Literal["str", "int", "float", "file", "directory"]
     default: str | None
@@ -105,7 +183,7 @@ class Option(Flag):
         )
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True, slots=True)
 class OptionInstance(Option):
     value: str | int | float | Path
 
@@ -113,23 +191,93 @@ class OptionInstance(Option):
         return hash(self.name)
 
     def __post_init__(self) -> None:
-        super().__post_init__()
+        # Slotted dataclasses are recreated by the decorator, so zero-argument super() does not work here
+        Option.__post_init__(self)
 
         try:
             if self.type == "int":
-                self.value = int(self.value)  # type: ignore
+                object.__setattr__(self, "value", int(self.value))  # type: ignore
             elif self.type == "float":
-                self.value = float(self.value)  # type: ignore
+                object.__setattr__(self, "value", float(self.value))  # type: ignore
             elif self.type in ["file", "directory"]:
-                self.value = Path(self.value)  # type: ignore
-                if self.type == "file" and self.value.exists() and not self.value.is_file():
-                    raise FonkConfigurationError(f"{self.value} is not a file")
-                if self.type == "directory" and self.value.exists() and not self.value.is_dir():
-                    raise FonkConfigurationError(f"{self.value} is not a directory")
+                value = Path(self.value)  # type: ignore
+                object.__setattr__(self, "value", value)
+                if self.type == "file" and value.exists() and not value.is_file():
+                    raise FonkConfigurationError(f"{value} is not a file")
+                if self.type == "directory" and value.exists() and not value.is_dir():
+                    raise FonkConfigurationError(f"{value} is not a directory")
         except (ValueError, TypeError):
             raise FonkConfigurationError(f"Invalid value for {self.name}: {self.value}")
 
 
+def _default_instance(flag: Flag) -> Flag:
+    # Options that an alias turns on without a value from the command line use their default value
+    if not isinstance(flag, Option) or isinstance(flag, OptionInstance) or flag.default is None:
+        return flag
+
+    return OptionInstance(
+        name=flag.name,
+        shorthand=flag.shorthand,
+        description=flag.description,
+        is_builtin=flag.is_builtin,
+        type=flag.type,
+        default=flag.default,
+        value=flag.default,
+    )
+
+
+class FlagSet:
+    __slots__ = ("mask", "table")
+
+    def __init__(self, table: "FlagTable", mask: int) -> None:
+        self.table = table
+        self.mask = mask
+
+    def __iter__(self) -> Iterator[Flag]:
+        mask = self.mask
+        for flag in self.table.flags:
+            if not mask:
+                return
+            if mask & 1:
+                yield flag
+            mask >>= 1
+
+    def __contains__(self, flag: object) -> bool:
+        return isinstance(flag, Flag) and bool(self.mask & self.table.bits.get(flag.name, 0))
+
+    def __len__(self) -> int:
+        return self.mask.bit_count()
+
+    def __repr__(self) -> str:
+        return f"FlagSet({', '.join(flag.name for flag in self)})"
+
+    def union(self, names: Iterable[str]) -> "FlagSet":
+        return self.table.intern(self.mask | self.table.mask(names))
+
+
+class FlagTable:
+    __slots__ = ("bits", "flags", "interned")
+
+    def __init__(self, flags: Iterable[Flag]) -> None:
+        self.flags = tuple(flags)
+        self.bits = {flag.name: 1 << index for index, flag in enumerate(self.flags)}
+        self.interned: dict[int, FlagSet] = {}
+
+    def mask(self, names: Iterable[str]) -> int:
+        mask = 0
+        for name in names:
+            mask |= self.bits.get(name, 0)
+        return mask
+
+    def intern(self, mask: int) -> FlagSet:
+        if (flag_set := self.interned.get(mask)) is None:
+            flag_set = self.interned[mask] = FlagSet(self, mask)
+        return flag_set
+
+    def flag_set(self, flags: Iterable[Flag]) -> FlagSet:
+        return self.intern(self.mask(flag.name for flag in flags))
+
+
 FLAG_QUIET = Flag(name="quiet", shorthand="q", description="Suppress output", is_builtin=True)
 FLAG_VERBOSE = Flag(
     name="verbose",
@@ -152,30 +300,98 @@ FLAG_CONCURRENT = Option(
     description="Run commands concurrently. Specify number of jobs or 0 for CPU count",
     is_builtin=True,
 )
+FLAG_WORKERS = Option(
+    name="workers",
+    type="str",
+    default=None,
+    description="Also run commands on these fonk workers (comma separated host:port)",
+    is_builtin=True,
+)
+FLAG_PIN_CPUS = Flag(
+    name="pin-cpus",
+    description="Pin concurrent commands to disjoint sets of CPUs",
+    is_builtin=True,
+)
+FLAG_RESERVE_CPUS = Option(
+    name="reserve-cpus",
+    type="int",
+    default=None,
+    description="Keep this many CPUs free of commands for interactive use",
+    is_builtin=True,
+)
+FLAG_COMPLETION = Option(
+    name="completion",
+    type="str",
+    default=None,
+    description="Print the shell completion script for bash, zsh or fish",
+    is_builtin=True,
+)
+FLAG_DEADLINE = Option(
+    name="deadline",
+    type="float",
+    default=None,
+    description="Stop all commands that are still running after this many seconds",
+    is_builtin=True,
+)
+FLAG_FAILED = Flag(
+    name="failed",
+    description="Only rerun the commands that failed in the previous run",
+    is_builtin=True,
+)
+FLAG_RESUME = Flag(
+    name="resume",
+    description="Continue the previous run, skipping commands that already succeeded",
+    is_builtin=True,
+)
+FLAG_WORKSPACE = Flag(
+    name="workspace",
+    shorthand="w",
+    description="Run in every member project of the workspace",
+    is_builtin=True,
+)
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True, slots=True)
 class Default:
     command: str
-    flags: list[str]
+    flags: tuple[str, ...]
     description: str | None
 
     @classmethod
     def from_dict(cls, data: dict) -> Self:
         return cls(
             command=data["command"],
-            flags=data.get("flags", []),
+            flags=tuple(data.get("flags", [])),
             description=data.get("description"),
         )
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, frozen=True, slots=True)
+class Workspace:
+    members: list[str]
+    exclude: list[str]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Self:
+        return cls(
+            members=data.get("members", []),
+            exclude=data.get("exclude", []),
+        )
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
 class Config:
     project_name: str | None
+    root: Path | None = None
     default: Default | None = None
+    workspace: Workspace | None = None
     commands: dict[str, Command]
     aliases: dict[str, Alias]
-    flags: list[Flag | Option]
+    flags: tuple[Flag | Option, ...]
+
+    def flag_table(self, active: Iterable[Flag]) -> FlagTable:
+        instances = {flag.name: flag for flag in active}
+        return FlagTable(instances.get(flag.name) or _default_instance(flag) for flag in self.flags)
 
     def __post_init__(self) -> None:
         if self.default and self.default.command not in self.commands and self.default.command not in self.aliases:
@@ -201,28 +417,44 @@ class Config:
                     raise FonkConfigurationError(f"Unknown flag flag {aflag.on} used in {command.name}")
 
     @classmethod
-    def from_dict(cls, project_name: str | None, data: dict) -> Self:
+    def from_dict(cls, project_name: str | None, data: dict, root: Path | None = None) -> Self:
         return cls(
             project_name=project_name,
+            root=root,
             default=Default.from_dict(data["default"]) if "default" in data else None,
+            workspace=Workspace.from_dict(data["workspace"]) if "workspace" in data else None,
             commands={name: Command.from_dict(name, command) for name, command in data.get("command", {}).items()},
             aliases={name: Alias.from_dict(alias) for name, alias in data.get("alias", {}).items()},
-            flags=[Option.from_dict(flag) if "type" in flag else Flag.from_dict(flag) for flag in data.get("flags", [])]
-            + [
+            flags=(
+                *(Option.from_dict(flag) if "type" in flag else Flag.from_dict(flag) for flag in data.get("flags", [])),
                 FLAG_QUIET,
                 FLAG_VERBOSE,
                 FLAG_FAIL_QUICK,
                 FLAG_HELP,
                 FLAG_CONCURRENT,
-            ],
+                FLAG_DEADLINE,
+                FLAG_FAILED,
+                FLAG_RESUME,
+                FLAG_WORKSPACE,
+                FLAG_WORKERS,
+                FLAG_PIN_CPUS,
+                FLAG_RESERVE_CPUS,
+                FLAG_COMPLETION,
+            ),
         )
 
 
 def get_config(cwd: Path | None = None) -> Config:
-    with get_pyproject(cwd).open("rb") as file:
+    pyproject_path = get_pyproject(cwd)
+
+    with pyproject_path.open("rb") as file:
         pyproject = load(file)
 
     project_name = pyproject.get("project", {}).get("name")
     this_tool_config = pyproject.get("tool", {}).get("fonk", {})
+    uv_workspace = pyproject.get("tool", {}).get("uv", {}).get("workspace")
+
+    if uv_workspace is not None and "workspace" not in this_tool_config:
+        this_tool_config = {**this_tool_config, "workspace": uv_workspace}
 
-    return Config.from_dict(project_name, this_tool_config)
+    return Config.from_dict(project_name, this_tool_config, root=pyproject_path.parent)
@@ -1,5 +1,7 @@
 from pathlib import Path
 
+STATE_DIRECTORY = ".fonk"
+
 
 def get_pyproject(cwd: Path | None = None) -> Path:
     cwd = cwd or Path.cwd()
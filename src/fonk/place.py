@@ -0,0 +1,47 @@
+# Runs between fonk and a command: sets the nice level and CPU affinity on itself and then becomes the command,
+# so that every thread and process the command starts inherits them
+import os
+import sys
+from argparse import REMAINDER, ArgumentParser
+
+
+def _cpus(value: str) -> set[int]:
+    return {int(cpu) for cpu in value.split(",")}
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(prog="python -m fonk.place", description="Run a command with a nice level and CPU set")
+    parser.add_argument("--priority", type=int, default=None, help="Nice level to run the command at")
+    parser.add_argument("--cpus", type=_cpus, default=None, help="Comma separated CPUs to pin the command to")
+    parser.add_argument("command", nargs=REMAINDER)
+    parsed = parser.parse_args(args)
+    command = parsed.command[1:] if parsed.command[:1] == ["--"] else parsed.command
+
+    if not command:
+        parser.error("no command given")
+
+    if parsed.priority is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, parsed.priority)
+        except OSError as e:
+            print(
+                f"💥 Could not set the nice level of {command[0]} to {parsed.priority}: {e.strerror}", file=sys.stderr
+            )
+
+    if parsed.cpus:
+        try:
+            os.sched_setaffinity(0, parsed.cpus)
+        except OSError as e:
+            print(f"💥 Could not pin {command[0]} to CPUs {sorted(parsed.cpus)}: {e.strerror}", file=sys.stderr)
+
+    sys.stderr.flush()
+
+    try:
+        os.execvp(command[0], command)
+    except OSError as e:
+        print(f"💥 Could not run {command[0]}: {e.strerror}", file=sys.stderr)
+        sys.exit(127)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import signal
+import sys
+from collections.abc import Sequence
+from contextlib import suppress
+from pathlib import Path
+from subprocess import Popen
+
+
+def pipefail(stages: list[list[str]], returncodes: list[int]) -> tuple[int, list[str]]:
+    # Like `set -o pipefail`: the rightmost non-zero exit status is the status of the whole pipeline
+    returncode = next((code for code in reversed(returncodes) if code != 0), 0)
+
+    if len(stages) == 1:
+        return returncode, []
+
+    return returncode, [
+        f"stage {index} ({stage[0]}) exited with {code}"
+        for index, (stage, code) in enumerate(zip(stages, returncodes, strict=True))
+        if code != 0
+    ]
+
+
+def kill_process_groups(processes: Sequence[Popen[bytes] | asyncio.subprocess.Process]) -> None:
+    # Every stage leads its own process group: a group cannot be joined once its leader has been reaped
+    for process in processes:
+        with suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def placement(cpus: set[int] | None, priority: int | None) -> list[str]:
+    if not cpus and priority is None:
+        return []
+
+    # Set by a wrapper that execs the stage rather than on the spawned pid, which would only cover its first thread,
+    # and rather than in a preexec_fn, which is unsafe next to asyncio's child watcher threads
+    prefix = [sys.executable, "-P", "-m", "fonk.place"]
+
+    if priority is not None:
+        prefix.extend(["--priority", str(priority)])
+    if cpus:
+        prefix.extend(["--cpus", ",".join(str(cpu) for cpu in sorted(cpus))])
+
+    return [*prefix, "--"]
+
+
+def spawn_pipeline(stages: list[list[str]], grouped: bool, prefix: Sequence[str] = ()) -> list[Popen[bytes]]:
+    processes: list[Popen[bytes]] = []
+    stdin: int | None = None
+
+    # Stages are connected with OS pipes directly, the data never passes through fonk
+    for index, arguments in enumerate(stages):
+        read_fd, write_fd = os.pipe() if index < len(stages) - 1 else (None, None)
+
+        try:
+            processes.append(
+                Popen([*prefix, *arguments], stdin=stdin, stdout=write_fd, process_group=0 if grouped else None)
+            )
+        except BaseException:
+            if read_fd is not None:
+                os.close(read_fd)
+            raise
+        finally:
+            for fd in (stdin, write_fd):
+                if fd is not None:
+                    os.close(fd)
+
+        stdin = read_fd
+
+    return processes
+
+
+async def spawn_async_pipeline(
+    stages: list[list[str]],
+    env: dict[str, str],
+    cwd: Path | None,
+    grouped: bool,
+    prefix: Sequence[str] = (),
+) -> list[asyncio.subprocess.Process]:
+    processes: list[asyncio.subprocess.Process] = []
+    stdin: int | None = None
+
+    for index, arguments in enumerate(stages):
+        read_fd, write_fd = os.pipe() if index < len(stages) - 1 else (None, None)
+
+        try:
+            processes.append(
+                await asyncio.create_subprocess_exec(
+                    *prefix,
+                    *arguments,
+                    stdin=stdin,
+                    stdout=asyncio.subprocess.PIPE if write_fd is None else write_fd,
+                    stderr=asyncio.subprocess.PIPE,
+                    env=env,
+                    cwd=cwd,
+                    process_group=0 if grouped else None,
+                )
+            )
+        except BaseException:
+            if read_fd is not None:
+                os.close(read_fd)
+            raise
+        finally:
+            for fd in (stdin, write_fd):
+                if fd is not None:
+                    os.close(fd)
+
+        stdin = read_fd
+
+    return processes
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from base64 import b64decode, b64encode
+from contextlib import suppress
+from pathlib import Path
+from typing import Self
+
+import rich
+
+from fonk.config import Command, Config, Flag, FlagSet, Option, OptionInstance, get_config
+from fonk.errors import FonkCommandError, FonkConfigurationError
+from fonk.locator import get_pyproject
+from fonk.process import kill_process_groups, pipefail, placement, spawn_async_pipeline
+from fonk.runner import Executor, command_mods_stages
+
+WORKER_TOKEN_ENV = "FONK_WORKER_TOKEN"
+WORKER_DEFAULT_PORT = 7300
+WORKER_ERROR_RETURNCODE = 255
+WORKER_TIMEOUT_MARGIN = 10.0
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def pyproject_digest(root: Path) -> str:
+    return hashlib.sha256((root / "pyproject.toml").read_bytes()).hexdigest()
+
+
+def worker_token() -> str:
+    token = os.environ.get(WORKER_TOKEN_ENV)
+
+    if not token:
+        raise FonkCommandError(f"Set {WORKER_TOKEN_ENV} to the token shared with your workers")
+
+    return token
+
+
+def _parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+
+    if not host:
+        return address, WORKER_DEFAULT_PORT
+
+    try:
+        return host, int(port)
+    except ValueError:
+        raise FonkCommandError(f"Invalid worker address: {address}")
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader) -> dict:
+    line = await reader.readline()
+
+    if not line:
+        raise ConnectionError("connection closed")
+
+    message = json.loads(line)
+
+    if not isinstance(message, dict):
+        raise ValueError("expected a JSON object")
+
+    return message
+
+
+class RemoteExecutor(Executor):
+    def __init__(self, address: str, token: str, digest: str, slots: int) -> None:
+        self.name = address
+        self.host, self.port = _parse_address(address)
+        self.token = token
+        self.digest = digest
+        self.slots = slots
+
+    @classmethod
+    async def register(cls, address: str, token: str, digest: str) -> Self:
+        host, port = _parse_address(address)
+
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                await _send(writer, {"token": token, "pyproject": digest})
+                reply = await _receive(reader)
+            finally:
+                writer.close()
+
+            if "error" in reply:
+                raise FonkCommandError(f"Worker {address} refused: {reply['error']}")
+
+            jobs = int(reply["jobs"])
+        except (OSError, ValueError) as e:
+            raise FonkCommandError(f"Could not register worker {address}: {e}")
+        except (KeyError, TypeError):
+            raise FonkCommandError(f"Could not register worker {address}: no job count in its reply")
+
+        return cls(address, token, digest, jobs)
+
+    async def execute(
+        self,
+        command: Command,
+        flags: FlagSet,
+        stages: list[list[str]],
+        cwd: Path | None,
+        timeout: float | None,
+    ) -> tuple[bytes, bytes, int | None]:
+        if timeout is not None and timeout <= 0:
+            return b"", b"", None
+
+        request = {
+            "token": self.token,
+            "pyproject": self.digest,
+            "command": command.name,
+            "flags": {flag.name: str(flag.value) if isinstance(flag, OptionInstance) else None for flag in flags},
+            "timeout": timeout,
+        }
+        output = {"stdout": bytearray(), "stderr": bytearray()}
+
+        try:
+            # The worker enforces the timeout itself, the margin only covers workers that hang or become unreachable
+            returncode = await asyncio.wait_for(
+                self._exchange(request, output), None if timeout is None else timeout + WORKER_TIMEOUT_MARGIN
+            )
+        except TimeoutError:
+            output["stderr"] += f"💥 Worker {self.name} did not report back on {command.name} in time\n".encode()
+            return bytes(output["stdout"]), bytes(output["stderr"]), None
+        except (OSError, ValueError, KeyError) as e:
+            output["stderr"] += f"💥 Worker {self.name} failed to run {command.name}: {e}\n".encode()
+            return bytes(output["stdout"]), bytes(output["stderr"]), WORKER_ERROR_RETURNCODE
+
+        return bytes(output["stdout"]), bytes(output["stderr"]), returncode
+
+    async def _exchange(self, request: dict, output: dict[str, bytearray]) -> int | None:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        try:
+            await _send(writer, request)
+
+            while "returncode" not in (message := await _receive(reader)):
+                if "error" in message:
+                    raise ConnectionError(message["error"])
+
+                output[message["stream"]] += b64decode(message["data"])
+        finally:
+            writer.close()
+
+        return message["returncode"]
+
+
+async def _wait_all(processes: list[asyncio.subprocess.Process]) -> list[int]:
+    return [await process.wait() for process in processes]
+
+
+class Worker:
+    def __init__(self, root: Path, token: str, jobs: int) -> None:
+        self.root = root
+        self.token = token
+        self.jobs = jobs
+        self.semaphore = asyncio.Semaphore(jobs)
+        self.env = os.environ.copy()
+        self.env["FORCE_COLOR"] = "1"
+        self.digest = pyproject_digest(root)
+        self.config = get_config(root)
+
+    def _refresh(self) -> None:
+        # The checkout may be synced while the worker keeps running
+        if (digest := pyproject_digest(self.root)) != self.digest:
+            self.config = get_config(self.root)
+            self.digest = digest
+
+    def _flags(self, config: Config, values: dict[str, str | None]) -> FlagSet:
+        active: list[Flag] = []
+
+        for flag in config.flags:
+            if flag.name not in values:
+                continue
+
+            if isinstance(flag, Option) and values[flag.name] is not None:
+                active.append(
+                    OptionInstance(
+                        name=flag.name,
+                        shorthand=flag.shorthand,
+                        description=flag.description,
+                        is_builtin=flag.is_builtin,
+                        type=flag.type,
+                        default=flag.default,
+                        value=values[flag.name],  # type: ignore
+                    )
+                )
+            else:
+                active.append(flag)
+
+        return config.flag_table(active).flag_set(active)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await _receive(reader)
+            self._refresh()
+
+            if not hmac.compare_digest(str(request.get("token", "")).encode(), self.token.encode()):
+                await _send(writer, {"error": "invalid token"})
+            elif request.get("pyproject") != self.digest:
+                await _send(writer, {"error": f"checkout in {self.root} is not in sync with the coordinator"})
+            elif "command" not in request:
+                await _send(writer, {"jobs": self.jobs})
+            else:
+                await self.run(request, reader, writer)
+        except (OSError, ValueError, TypeError, FonkConfigurationError) as e:
+            with suppress(OSError):
+                await _send(writer, {"error": str(e)})
+        finally:
+            writer.close()
+
+    async def _pump(self, stream: asyncio.StreamReader, name: str, writer: asyncio.StreamWriter) -> None:
+        while data := await stream.read(_CHUNK_SIZE):
+            with suppress(OSError):
+                await _send(writer, {"stream": name, "data": b64encode(data).decode()})
+
+    async def run(self, request: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        config = self.config
+
+        if (command := config.commands.get(request["command"])) is None:
+            await _send(writer, {"error": f"unknown command {request['command']}"})
+            return
+
+        _, stages = command_mods_stages(command, self._flags(config, request.get("flags", {})))
+
+        async with self.semaphore:
+            prefix = placement(None, command.priority)
+            processes = await spawn_async_pipeline(stages, self.env, self.root, grouped=True, prefix=prefix)
+            pumps = [asyncio.create_task(self._pump(processes[-1].stdout, "stdout", writer))]  # type: ignore
+            pumps.extend(asyncio.create_task(self._pump(p.stderr, "stderr", writer)) for p in processes)  # type: ignore
+            finished = asyncio.create_task(_wait_all(processes))
+            # The coordinator never sends anything after its request, so reading only returns once it hangs up
+            disconnected = asyncio.create_task(reader.read())
+
+            done, _ = await asyncio.wait(
+                {finished, disconnected}, timeout=request.get("timeout"), return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if finished not in done:
+                kill_process_groups(processes)
+                await finished
+
+            disconnected.cancel()
+            await asyncio.gather(*pumps)
+
+        if finished not in done:
+            await _send(writer, {"returncode": None})
+            return
+
+        returncode, failures = pipefail(stages, finished.result())
+
+        for failure in failures:
+            await _send(writer, {"stream": "stderr", "data": b64encode(f"💥 {failure}\n".encode()).decode()})
+
+        await _send(writer, {"returncode": returncode})
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        name = self.config.project_name or self.root.name
+        rich.print(f"[bold red]🔥 Fonk worker for [cyan]{name}[/] listening on {host}:{port} with {self.jobs} jobs")
+
+        async with server:
+            await server.serve_forever()
+
+
+def app(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(prog="fonk-worker", description="Serve fonk commands to remote coordinators")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=WORKER_DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of commands to run at once")
+    parser.add_argument("--directory", type=Path, default=None, help="Checkout to run commands in")
+    parsed = parser.parse_args(args)
+
+    directory = parsed.directory.resolve() if parsed.directory else None
+    try:
+        worker = Worker(get_pyproject(directory).parent, worker_token(), parsed.jobs)
+        asyncio.run(worker.serve(parsed.host, parsed.port))
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except FonkConfigurationError as e:
+        rich.print(f"💥[bold red] Your configuration is invalid: {e}")
+        sys.exit(2)
+    except FonkCommandError as e:
+        rich.print(f"💥[bold red] Could not start the worker: {e}")
+        sys.exit(3)
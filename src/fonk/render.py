@@ -123,7 +123,13 @@ def render_header(quiet: bool) -> None:
     return
 
 
-def render_failures(failed: dict[str, int], quiet: bool) -> None:
+def _render_failure(name: str, status: int | None) -> str:
+    if status is None:
+        return f"{name} [bold]timed out[/]"
+    return f"{name} has returncode {status}"
+
+
+def render_failures(failed: dict[str, int | None], quiet: bool) -> None:
     console = Console()
 
     if not failed:
@@ -131,7 +137,7 @@ def render_failures(failed: dict[str, int], quiet: bool) -> None:
             console.rule(title="[bold green]✨ Fonky Fresh! ✨[/]", style="green")
         return
 
-    failures = [f"{fail} has returncode {status}" for fail, status in failed.items()]
+    failures = [_render_failure(fail, status) for fail, status in failed.items()]
 
     console.print(
         Panel(
@@ -146,6 +152,35 @@ def render_failures(failed: dict[str, int], quiet: bool) -> None:
     return
 
 
+def render_workspace_failures(failed: dict[str, dict[str, int | None]], projects: int, quiet: bool) -> None:
+    console = Console()
+
+    if not failed:
+        if not quiet:
+            console.rule(title=f"[bold green]✨ Fonky Fresh! ({projects} projects) ✨[/]", style="green")
+        return
+
+    failures = Table(box=None, pad_edge=False, show_header=False)
+
+    for project, commands in failed.items():
+        failures.add_row(
+            f"[magenta]{project}[/]",
+            "\n".join(_render_failure(command, status) for command, status in commands.items()),
+        )
+
+    console.print(
+        Panel(
+            failures,
+            title=f"[bold red]💥 Fonked Out! ({len(failed)}/{projects} projects) 💥[/]",
+            expand=True,
+            border_style="red",
+            padding=(0, 6),
+        )
+    )
+
+    return
+
+
 def render_help_command(config: Config, cmd: str) -> None:
     console = Console()
     help_content: list[str | Table] = []
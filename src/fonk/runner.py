@@ -1,12 +1,18 @@
 import asyncio
 import os
 import sys
-from contextlib import nullcontext
-from subprocess import CompletedProcess, run
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from subprocess import TimeoutExpired, run
 
 import rich
 
-from fonk.config import ApplyFlag, Command, Flag, OptionInstance
+from fonk.config import ApplyFlag, Command, Flag, FlagSet, OptionInstance
+from fonk.errors import FonkCommandError
+from fonk.process import kill_process_groups, pipefail, placement, spawn_async_pipeline, spawn_pipeline
 
 
 def _command_runner_prefix(command: Command) -> list[str]:
@@ -21,13 +27,15 @@ def _command_runner_prefix(command: Command) -> list[str]:
             return ["uvx"]
         case "poetry":
             return ["poetry", "run"]
+        case "pipeline":
+            return []
 
 
 def _apply_add_flags(flag: Flag, apply: ApplyFlag, args: list[str]) -> None:
     if not apply.add:
         return
 
-    to_add = apply.add if isinstance(apply.add, list) else [apply.add]
+    to_add = list(apply.add) if isinstance(apply.add, tuple) else [apply.add]
 
     if isinstance(flag, OptionInstance):
         to_add = [arg.replace("{arg}", str(flag.value)) for arg in to_add]
@@ -35,26 +43,110 @@ def _apply_add_flags(flag: Flag, apply: ApplyFlag, args: list[str]) -> None:
     args.extend(to_add)
 
 
-def _command_mods_args(command: Command, flags: set[Flag]) -> tuple[list[str], list[str]]:
+def command_mods_stages(command: Command, flags: FlagSet) -> tuple[list[str], list[list[str]]]:
     applied_mods: set[str] = set()
-    arguments = command.arguments.copy()
+    stages = [list(stage) for stage in command.stages] if command.type == "pipeline" else [list(command.arguments)]
 
     for flag in flags:
-        for apply_flag in command.flags:
-            if apply_flag.on == flag.name:
-                if isinstance(apply_flag.remove, list):
-                    arguments = [arg for arg in arguments if arg not in apply_flag.remove]
-                elif isinstance(apply_flag.remove, str):
-                    arguments.remove(apply_flag.remove)
+        for apply_flag in command.flag_index.get(flag.name, ()):
+            arguments = stages[apply_flag.stage or 0]
+
+            if isinstance(apply_flag.remove, tuple):
+                arguments[:] = [arg for arg in arguments if arg not in apply_flag.remove]
+            elif isinstance(apply_flag.remove, str):
+                arguments.remove(apply_flag.remove)
+
+            _apply_add_flags(flag, apply_flag, arguments)
+            applied_mods.add(flag.name)
+
+    stages[0][:0] = _command_runner_prefix(command)
+    return sorted(applied_mods), stages
+
+
+def _render_stages(stages: list[list[str]]) -> str:
+    return " | ".join(" ".join(stage) for stage in stages)
+
+
+def _command_timeout(command: Command, deadline: float | None) -> float | None:
+    if deadline is None:
+        return command.timeout
+
+    remaining = max(deadline - time.monotonic(), 0.0)
+    return remaining if command.timeout is None else min(command.timeout, remaining)
+
+
+class CpuPool:
+    def __init__(self, reserved: int = 0, pin: bool = False) -> None:
+        if not hasattr(os, "sched_setaffinity"):
+            raise FonkCommandError("Setting CPU affinity is not supported on this platform")
+
+        available = sorted(os.sched_getaffinity(0))
+
+        if reserved >= len(available):
+            raise FonkCommandError(f"Cannot reserve {reserved} of the {len(available)} available CPUs")
 
-                _apply_add_flags(flag, apply_flag, arguments)
-                applied_mods.add(flag.name)
+        self.reserved = available[:reserved]
+        self.cpus = available[reserved:]
+        self.free = list(self.cpus)
+        self.pin = pin
 
-    return sorted(applied_mods), _command_runner_prefix(command) + arguments
+    @contextmanager
+    def allocate(self, parallelism: int | None, slots: int) -> Iterator[set[int]]:
+        # Commands that do not declare their parallelism get a fair share of the CPUs over all admitted jobs,
+        # once every CPU is taken the remaining commands share all of them rather than waiting
+        share = min(parallelism or max(len(self.cpus) // slots, 1), len(self.free))
 
+        if not self.pin or share == 0:
+            yield set(self.cpus)
+            return
 
-def run_command(command: Command, flags: set[Flag], quiet: bool, verbose: bool) -> CompletedProcess[bytes]:
-    applied_mods, arguments = _command_mods_args(command, flags)
+        taken = self.free[:share]
+        del self.free[:share]
+
+        try:
+            yield set(taken)
+        finally:
+            self.free = sorted(self.free + taken)
+
+
+def _run_with_timeout(
+    stages: list[list[str]], timeout: float | None, prefix: Sequence[str] = ()
+) -> tuple[int | None, list[str]]:
+    if timeout is None and len(stages) == 1:
+        return run([*prefix, *stages[0]], check=False).returncode, []
+
+    if timeout is not None and timeout <= 0:
+        return None, []
+
+    # With a timeout the command gets its own process group so that everything it spawned is killed along with it
+    processes = spawn_pipeline(stages, grouped=timeout is not None, prefix=prefix)
+    end = None if timeout is None else time.monotonic() + timeout
+
+    try:
+        returncodes = [process.wait(None if end is None else max(end - time.monotonic(), 0.0)) for process in processes]
+    except TimeoutExpired:
+        kill_process_groups(processes)
+        for process in processes:
+            process.wait()
+        return None, []
+    except KeyboardInterrupt:
+        if timeout is not None:
+            kill_process_groups(processes)
+        raise
+
+    return pipefail(stages, returncodes)
+
+
+def run_command(
+    command: Command,
+    flags: FlagSet,
+    quiet: bool,
+    verbose: bool,
+    *,
+    deadline: float | None = None,
+    cpu_pool: CpuPool | None = None,
+) -> int | None:
+    applied_mods, stages = command_mods_stages(command, flags)
 
     if not quiet:
         rich.print(
@@ -62,22 +154,32 @@ def run_command(command: Command, flags: set[Flag], quiet: bool, verbose: bool)
         )
 
     if verbose:
-        rich.print(f"[bold]🔹[/] {' '.join(arguments)}")
+        rich.print(f"[bold]🔹[/] {_render_stages(stages)}")
+
+    prefix = placement(set(cpu_pool.cpus) if cpu_pool else None, command.priority)
+    returncode, failures = _run_with_timeout(stages, _command_timeout(command, deadline), prefix)
+
+    for failure in failures:
+        rich.print(f"[bold red]💥 {failure}")
+
+    if returncode is None:
+        rich.print(f"[bold red]⏰ {command.name} timed out")
 
-    result = run(arguments, check=False)
     print()
-    return result
+    return returncode
 
 
 def _process_command(
     stdout: bytes,
     stderr: bytes,
-    retcode: int,
+    retcode: int | None,
     name: str,
-    arguments: list[str],
+    stages: list[list[str]],
     quiet: bool,
     verbose: bool,
     mods: list[str],
+    *,
+    executor: str | None = None,
 ) -> None:
     if not quiet or retcode != 0:
         if mods:
@@ -86,71 +188,240 @@ def _process_command(
             rich.print(f"[bold red]🔥 Ran {name}")
 
     if verbose:
-        rich.print(f"[bold]🔹[/] {' '.join(arguments)}")
+        if executor:
+            rich.print(f"[bold]🔹[/] on {executor}")
+        rich.print(f"[bold]🔹[/] {_render_stages(stages)}")
 
     if (not quiet or retcode != 0) and stdout:
         print(stdout.decode().rstrip())
     if (not quiet or retcode != 0) and stderr:
         print(stderr.decode().rstrip())
+    if retcode is None:
+        rich.print(f"[bold red]⏰ {name} timed out")
     if (not quiet or retcode != 0) and (stdout or stderr):
         print()
 
 
+async def _collect(processes: list[asyncio.subprocess.Process]) -> tuple[bytes, bytes, list[int]]:
+    stdout, *stderr = await asyncio.gather(
+        processes[-1].stdout.read(),  # type: ignore
+        *(process.stderr.read() for process in processes),  # type: ignore
+    )
+    return stdout, b"".join(stderr), [await process.wait() for process in processes]
+
+
+async def _async_subprocess(
+    stages: list[list[str]],
+    env: dict[str, str],
+    cwd: Path | None,
+    timeout: float | None,
+    prefix: Sequence[str] = (),
+) -> tuple[bytes, bytes, int | None]:
+    if timeout is not None and timeout <= 0:
+        return b"", b"", None
+
+    processes = await spawn_async_pipeline(stages, env, cwd, grouped=timeout is not None, prefix=prefix)
+
+    # Shielded so that the output produced before the timeout can still be collected after the kill
+    collect = asyncio.ensure_future(_collect(processes))
+
+    try:
+        stdout, stderr, returncodes = await asyncio.wait_for(asyncio.shield(collect), timeout)
+    except TimeoutError:
+        kill_process_groups(processes)
+        stdout, stderr, _ = await collect
+        return stdout, stderr, None
+    except asyncio.CancelledError:
+        if timeout is not None:
+            kill_process_groups(processes)
+        raise
+
+    returncode, failures = pipefail(stages, returncodes)
+    return stdout, stderr + "".join(f"💥 {failure}\n" for failure in failures).encode(), returncode
+
+
+class Executor(ABC):
+    name: str
+    slots: int
+
+    @abstractmethod
+    async def execute(
+        self,
+        command: Command,
+        flags: FlagSet,
+        stages: list[list[str]],
+        cwd: Path | None,
+        timeout: float | None,
+    ) -> tuple[bytes, bytes, int | None]: ...
+
+
+class LocalExecutor(Executor):
+    def __init__(self, slots: int, cpu_pool: CpuPool | None = None) -> None:
+        self.name = "local"
+        self.slots = slots
+        self.cpu_pool = cpu_pool
+        self.env = os.environ.copy()
+        self.env["FORCE_COLOR"] = "1"
+
+    async def execute(
+        self,
+        command: Command,
+        flags: FlagSet,
+        stages: list[list[str]],
+        cwd: Path | None,
+        timeout: float | None,
+    ) -> tuple[bytes, bytes, int | None]:
+        if self.cpu_pool is None:
+            return await _async_subprocess(stages, self.env, cwd, timeout, placement(None, command.priority))
+
+        with self.cpu_pool.allocate(command.parallelism, self.slots) as cpus:
+            return await _async_subprocess(stages, self.env, cwd, timeout, placement(cpus, command.priority))
+
+
+def _slot_pool(executors: Sequence[Executor]) -> asyncio.Queue[Executor]:
+    pool: asyncio.Queue[Executor] = asyncio.Queue()
+
+    # Slots are queued from the executors in turn, so that every executor gets work when there are fewer commands
+    for slot in range(max((executor.slots for executor in executors), default=0)):
+        for executor in executors:
+            if slot < executor.slots:
+                pool.put_nowait(executor)
+
+    return pool
+
+
 async def _async_subprocess_limited(
+    command: Command,
+    flags: FlagSet,
+    *,
     name: str,
-    arguments: list[str],
-    env: dict[str, str],
+    stages: list[list[str]],
     quiet: bool,
     verbose: bool,
     mods: list[str],
     lock: asyncio.Lock,
-    semaphore: asyncio.Semaphore | None,
-) -> tuple[str, int]:
-    async with semaphore or nullcontext():
-        process = await asyncio.create_subprocess_exec(
-            *arguments,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env=env,
+    pool: asyncio.Queue[Executor],
+    on_finished: Callable[[Command, FlagSet, int | None], None] | None,
+    cwd: Path | None = None,
+    deadline: float | None = None,
+) -> tuple[str, int | None]:
+    executor = await pool.get()
+
+    try:
+        stdout, stderr, retcode = await executor.execute(
+            command, flags, stages, cwd, _command_timeout(command, deadline)
         )
-        stdout, stderr = await process.communicate()
+    finally:
+        pool.put_nowait(executor)
 
     async with lock:
-        retcode: int = process.returncode  # type: ignore
-        _process_command(stdout, stderr, retcode, name, arguments, quiet, verbose, mods)
+        _process_command(
+            stdout,
+            stderr,
+            retcode,
+            name,
+            stages,
+            quiet,
+            verbose,
+            mods,
+            executor=executor.name if executor.name != "local" else None,
+        )
+
+        if on_finished:
+            on_finished(command, flags, retcode)
 
     return name, retcode
 
 
 async def run_commands_concurrently(
-    commands_with_flags: list[tuple[Command, set[Flag]]],
+    commands_with_flags: list[tuple[Command, FlagSet]],
     quiet: bool,
     verbose: bool,
+    *,
     limit_concurrency: int | None = None,
-) -> dict[str, int]:
-    tasks: list[asyncio.Task[tuple[str, int]]] = []
-    env = os.environ.copy()
-    env["FORCE_COLOR"] = "1"
-
-    semaphore = asyncio.Semaphore(limit_concurrency) if limit_concurrency else None
+    on_finished: Callable[[Command, FlagSet, int | None], None] | None = None,
+    deadline: float | None = None,
+    remote: Sequence[Executor] = (),
+    cpu_pool: CpuPool | None = None,
+) -> dict[str, int | None]:
+    tasks: list[asyncio.Task[tuple[str, int | None]]] = []
+
+    # Without a limit every command can run locally at once, unless there are workers to share them with
+    slots = limit_concurrency or (os.cpu_count() if remote else len(commands_with_flags)) or 1
+    pool = _slot_pool([LocalExecutor(slots, cpu_pool), *remote])
     print_lock = asyncio.Lock()
 
     for command, flags in commands_with_flags:
-        mods, args = _command_mods_args(command, flags)
+        mods, stages = command_mods_stages(command, flags)
         tasks.append(
             asyncio.create_task(
                 coro=_async_subprocess_limited(
+                    command=command,
+                    flags=flags,
                     name=command.name,
-                    arguments=args,
-                    env=env,
+                    stages=stages,
                     quiet=quiet,
                     verbose=verbose,
                     mods=mods,
                     lock=print_lock,
-                    semaphore=semaphore,
+                    pool=pool,
+                    on_finished=on_finished,
+                    deadline=deadline,
                 )
             )
         )
 
     processes = await asyncio.gather(*tasks)
     return {name: retcode for name, retcode in processes if retcode != 0}
+
+
+async def run_projects_concurrently(
+    projects: dict[str, tuple[Path, list[tuple[Command, FlagSet]]]],
+    quiet: bool,
+    verbose: bool,
+    *,
+    limit_concurrency: int | None = None,
+    deadline: float | None = None,
+    cpu_pool: CpuPool | None = None,
+) -> dict[str, dict[str, int | None]]:
+    tasks: dict[str, list[asyncio.Task[tuple[str, int | None]]]] = {}
+
+    total = sum(len(commands_with_flags) for _, commands_with_flags in projects.values())
+    pool = _slot_pool([LocalExecutor(limit_concurrency or total or 1, cpu_pool)])
+    print_lock = asyncio.Lock()
+
+    for project, (cwd, commands_with_flags) in projects.items():
+        tasks[project] = []
+
+        for command, flags in commands_with_flags:
+            mods, stages = command_mods_stages(command, flags)
+            tasks[project].append(
+                asyncio.create_task(
+                    coro=_async_subprocess_limited(
+                        command=command,
+                        flags=flags,
+                        name=f"{project}:{command.name}",
+                        stages=stages,
+                        quiet=quiet,
+                        verbose=verbose,
+                        mods=mods,
+                        lock=print_lock,
+                        pool=pool,
+                        on_finished=None,
+                        cwd=cwd,
+                        deadline=deadline,
+                    )
+                )
+            )
+
+    await asyncio.gather(*(task for project_tasks in tasks.values() for task in project_tasks))
+
+    failed: dict[str, dict[str, int | None]] = {}
+
+    for project, project_tasks in tasks.items():
+        for task in project_tasks:
+            name, retcode = task.result()
+            if retcode != 0:
+                failed.setdefault(project, {})[name.removeprefix(f"{project}:")] = retcode
+
+    return failed
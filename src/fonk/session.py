@@ -1,48 +1,103 @@
+import asyncio
 import functools
 import operator
+import os
 import sys
+from collections.abc import Iterable
+from pathlib import Path
 
+import rich
 from rich.console import Console
 
-from fonk.config import Command, Config, Flag
+from fonk.config import Command, Config, Flag, FlagSet
 from fonk.errors import FonkCommandError
-from fonk.render import render_failures, render_header
-from fonk.runner import run_command, run_commands_concurrently
+from fonk.remote import RemoteExecutor, pyproject_digest, worker_token
+from fonk.render import render_failures, render_header, render_workspace_failures
+from fonk.runner import CpuPool, run_command, run_commands_concurrently, run_projects_concurrently
+from fonk.state import RunState, save_state, session_flags
+
+
+def gather_commands(config: Config, runnable: str, flags: FlagSet) -> list[tuple[Command, FlagSet]]:
+    if alias := config.aliases.get(runnable):
+        mods = flags.union(alias.flags)
+        return functools.reduce(
+            operator.iadd, (gather_commands(config, runnable, mods) for runnable in alias.commands), []
+        )
+    elif command := config.commands.get(runnable):
+        return [(command, flags)]
+
+    raise FonkCommandError(f"Unknown command or alias: {runnable}")
+
+
+def gather_commands_deduped(
+    config: Config, runnables: list[str], flags: Iterable[Flag]
+) -> list[tuple[Command, FlagSet]]:
+    flag_set = config.flag_table(flags).flag_set(flags)
+    commands_with_flags: dict[tuple[str, int], tuple[Command, FlagSet]] = {}
+
+    for runnable in runnables:
+        for command, mods in gather_commands(config, runnable, flag_set):
+            commands_with_flags.setdefault((command.name, mods.mask), (command, mods))
+
+    return list(commands_with_flags.values())
 
 
 class Session:
-    def __init__(self, config: Config, quiet: bool, verbose: bool, fail_quick: bool = False) -> None:
-        self.failed: dict[str, int] = {}
+    def __init__(
+        self,
+        config: Config,
+        quiet: bool,
+        verbose: bool,
+        fail_quick: bool = False,
+        *,
+        previous: RunState | None = None,
+        only_failed: bool = False,
+        deadline: float | None = None,
+        cpu_pool: CpuPool | None = None,
+    ) -> None:
+        self.failed: dict[str, int | None] = {}
         self.config = config
+        self.deadline = deadline
+        self.cpu_pool = cpu_pool
         self.fail_quick = fail_quick
         self.quiet = quiet
         self.verbose = verbose
+        self.previous = previous
+        self.only_failed = only_failed
+        self.state = RunState(runnables=[])
         self.console = Console()
         render_header(quiet)
 
-    def gather_commands(self, runnable: str, flags: set[Flag]) -> list[tuple[Command, set[Flag]]]:
-        if alias := self.config.aliases.get(runnable):
-            mods = flags.union(m for m in self.config.flags if m.name in alias.flags)
-            return functools.reduce(
-                operator.iadd, (self.gather_commands(runnable, mods) for runnable in alias.commands), []
-            )
-        elif command := self.config.commands.get(runnable):
-            return [(command, flags)]
+    def gather_commands(self, runnable: str, flags: set[Flag]) -> list[tuple[Command, FlagSet]]:
+        return gather_commands(self.config, runnable, self.config.flag_table(flags).flag_set(flags))
+
+    def gather_commands_deduped(self, runnables: list[str], flags: set[Flag]) -> list[tuple[Command, FlagSet]]:
+        return gather_commands_deduped(self.config, runnables, flags)
+
+    def gather_commands_pending(self, runnables: list[str], flags: set[Flag]) -> list[tuple[Command, FlagSet]]:
+        commands_with_flags = self.gather_commands_deduped(runnables, flags)
+        self.state = RunState(runnables=runnables.copy(), flags=session_flags(self.config, flags))
+
+        if self.previous is None:
+            return commands_with_flags
 
-        raise FonkCommandError(f"Unknown command or alias: {runnable}")
+        pending = []
 
-    def gather_commands_deduped(self, runnables: list[str], flags: set[Flag]) -> list[tuple[Command, set[Flag]]]:
-        commands_with_flags = []
+        for command, mods in commands_with_flags:
+            if self.previous.has_succeeded(command, mods):
+                self.state.record(command, mods, 0)
+            elif not self.only_failed or self.previous.has_failed(command, mods):
+                pending.append((command, mods))
 
-        for runnable in runnables:
-            for command, mods in self.gather_commands(runnable, flags):
-                if (command, mods) not in commands_with_flags:
-                    commands_with_flags.append((command, mods))
+        if not pending and self.only_failed:
+            rich.print("[bold yellow]✨ No command failed in the previous run, nothing to rerun")
+        elif not pending:
+            rich.print("[bold yellow]✨ Every command succeeded in the previous run, nothing to resume")
 
-        return commands_with_flags
+        return pending
 
     def run_runnables(self, runnables: list[str], flags: set[Flag]) -> None:
-        for command, mods in self.gather_commands_deduped(runnables, flags):
+        for command, mods in self.gather_commands_pending(runnables, flags):
             self.run_command(command, mods)
 
     async def run_runnables_concurrently(
@@ -50,25 +105,104 @@ class Session:
         runnables: list[str],
         flags: set[Flag],
         limit_concurrency: int | None = None,
+        workers: list[str] | None = None,
     ) -> None:
-        commands_with_flags = self.gather_commands_deduped(runnables, flags)
+        commands_with_flags = self.gather_commands_pending(runnables, flags)
+        remote = await self.register_workers(workers) if workers else []
 
         failed = await run_commands_concurrently(
             commands_with_flags,
             self.quiet,
             self.verbose,
             limit_concurrency=limit_concurrency,
+            on_finished=self.state.record,
+            deadline=self.deadline,
+            remote=remote,
+            cpu_pool=self.cpu_pool,
         )
         self.failed.update(failed)
 
-    def run_command(self, command: Command, flags: set[Flag]) -> None:
-        result = run_command(command, flags, self.quiet, self.verbose)
-        if result.returncode != 0:
+    async def register_workers(self, workers: list[str]) -> list[RemoteExecutor]:
+        if self.config.root is None:
+            raise FonkCommandError("Workers need a pyproject.toml to check their checkout against")
+
+        token = worker_token()
+        digest = pyproject_digest(self.config.root)
+
+        return list(await asyncio.gather(*(RemoteExecutor.register(worker, token, digest) for worker in workers)))
+
+    def run_command(self, command: Command, flags: FlagSet) -> None:
+        returncode = run_command(
+            command, flags, self.quiet, self.verbose, deadline=self.deadline, cpu_pool=self.cpu_pool
+        )
+        self.state.record(command, flags, returncode)
+
+        if returncode != 0:
             if self.fail_quick:
+                self.save_state()
                 sys.exit(1)
 
-            self.failed[command.name] = result.returncode
+            self.failed[command.name] = returncode
+
+    def save_state(self) -> None:
+        save_state(self.config.root, self.state)
 
     def exit(self) -> None:
+        self.save_state()
         render_failures(self.failed, self.quiet)
         sys.exit(1 if self.failed else 0)
+
+
+class WorkspaceSession:
+    def __init__(
+        self,
+        members: dict[str, tuple[Path, Config]],
+        quiet: bool,
+        verbose: bool,
+        deadline: float | None = None,
+        cpu_pool: CpuPool | None = None,
+    ) -> None:
+        self.failed: dict[str, dict[str, int | None]] = {}
+        self.deadline = deadline
+        self.cpu_pool = cpu_pool
+        self.projects = 0
+        self.members = members
+        self.quiet = quiet
+        self.verbose = verbose
+        render_header(quiet)
+
+    def gather_commands(self, runnables: list[str], flags: set[Flag]) -> dict[str, list[tuple[Command, FlagSet]]]:
+        projects = {}
+
+        for project, (_, config) in self.members.items():
+            available = [r for r in runnables if r in config.commands or r in config.aliases]
+
+            if available:
+                projects[project] = gather_commands_deduped(config, available, flags)
+
+        if not projects:
+            raise FonkCommandError(f"No workspace member provides {' '.join(runnables)}")
+
+        return projects
+
+    async def run_runnables_concurrently(
+        self,
+        runnables: list[str],
+        flags: set[Flag],
+        limit_concurrency: int | None = None,
+    ) -> None:
+        projects = self.gather_commands(runnables, flags)
+
+        self.failed = await run_projects_concurrently(
+            {project: (self.members[project][0], commands) for project, commands in projects.items()},
+            self.quiet,
+            self.verbose,
+            limit_concurrency=limit_concurrency or os.cpu_count(),
+            deadline=self.deadline,
+            cpu_pool=self.cpu_pool,
+        )
+        self.projects = len(projects)
+
+    def exit(self) -> None:
+        render_workspace_failures(self.failed, self.projects, self.quiet)
+        sys.exit(1 if self.failed else 0)
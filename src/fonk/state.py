@@ -0,0 +1,118 @@
+import json
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Self
+
+from fonk.config import Command, Config, Flag, FlagSet, OptionInstance
+from fonk.locator import STATE_DIRECTORY
+
+STATE_FILE = "state.json"
+
+RunKey = tuple[str, tuple[str, ...]]
+
+
+def _flag_token(flag: Flag) -> str:
+    return f"{flag.name}={flag.value}" if isinstance(flag, OptionInstance) else flag.name
+
+
+def run_flags(command: Command, flags: FlagSet) -> list[str]:
+    applied = {apply_flag.on for apply_flag in command.flags}
+    return sorted(_flag_token(flag) for flag in flags if flag.name in applied)
+
+
+def session_flags(config: Config, flags: Iterable[Flag]) -> list[str]:
+    # Only the flags that change what a command runs identify a run, not the ones that change how fonk runs it
+    applied = {apply_flag.on for command in config.commands.values() for apply_flag in command.flags}
+    return sorted(_flag_token(flag) for flag in flags if flag.name in applied)
+
+
+@dataclass(kw_only=True)
+class RunRecord:
+    command: str
+    flags: list[str]
+    returncode: int | None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Self:
+        return cls(
+            command=data["command"],
+            flags=data.get("flags", []),
+            returncode=data["returncode"],
+        )
+
+    @property
+    def key(self) -> RunKey:
+        return self.command, tuple(self.flags)
+
+
+@dataclass(kw_only=True)
+class RunState:
+    runnables: list[str]
+    flags: list[str] = field(default_factory=list)
+    # Keyed on RunRecord.key so recording and lookups stay constant time on large configs
+    failed: dict[RunKey, RunRecord] = field(default_factory=dict)
+    succeeded: dict[RunKey, RunRecord] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Self:
+        failed = (RunRecord.from_dict(record) for record in data.get("failed", []))
+        succeeded = (RunRecord.from_dict(record) for record in data.get("succeeded", []))
+        return cls(
+            runnables=data["runnables"],
+            flags=data.get("flags", []),
+            failed={record.key: record for record in failed},
+            succeeded={record.key: record for record in succeeded},
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "runnables": self.runnables,
+            "flags": self.flags,
+            "failed": [asdict(record) for record in self.failed.values()],
+            "succeeded": [asdict(record) for record in self.succeeded.values()],
+        }
+
+    def record(self, command: Command, flags: FlagSet, returncode: int | None) -> None:
+        record = RunRecord(command=command.name, flags=run_flags(command, flags), returncode=returncode)
+        self.failed.pop(record.key, None)
+        self.succeeded.pop(record.key, None)
+
+        if returncode != 0:
+            self.failed[record.key] = record
+        else:
+            self.succeeded[record.key] = record
+
+    def has_failed(self, command: Command, flags: FlagSet) -> bool:
+        return (command.name, tuple(run_flags(command, flags))) in self.failed
+
+    def has_succeeded(self, command: Command, flags: FlagSet) -> bool:
+        return (command.name, tuple(run_flags(command, flags))) in self.succeeded
+
+
+def _state_path(root: Path) -> Path:
+    return root / STATE_DIRECTORY / STATE_FILE
+
+
+def load_state(root: Path | None) -> RunState | None:
+    if root is None:
+        return None
+
+    try:
+        with _state_path(root).open("r") as file:
+            return RunState.from_dict(json.load(file))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_state(root: Path | None, state: RunState) -> None:
+    if root is None:
+        return
+
+    path = _state_path(root)
+
+    try:
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(json.dumps(state.to_dict(), indent=2))
+    except OSError:
+        pass
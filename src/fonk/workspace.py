@@ -0,0 +1,120 @@
+import contextlib
+import glob
+import json
+from pathlib import Path
+
+from fonk.config import Config, get_config
+from fonk.errors import FonkConfigurationError
+from fonk.locator import STATE_DIRECTORY
+
+WORKSPACE_INDEX_FILE = "workspace.json"
+
+
+def _static_base(root: Path, pattern: str) -> Path:
+    parts = []
+
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+
+    return root.joinpath(*parts)
+
+
+def _glob_directories(root: Path, patterns: list[str]) -> set[Path]:
+    return {path for pattern in patterns for path in root.glob(pattern) if path.is_dir()}
+
+
+def _watched_directories(root: Path, patterns: list[str], matched: set[Path]) -> set[Path]:
+    watched = {root} | {_static_base(root, pattern) for pattern in patterns}
+
+    # Every matched directory is watched, not just the members: adding a pyproject.toml turns one into a member
+    for directory in matched:
+        watched.add(directory)
+        watched.update(parent for parent in directory.parents if parent.is_relative_to(root))
+
+    return watched
+
+
+def _mtimes(directories: set[Path]) -> dict[str, float]:
+    mtimes = {}
+
+    for directory in directories:
+        try:
+            mtimes[str(directory)] = directory.stat().st_mtime
+        except OSError:
+            mtimes[str(directory)] = -1.0
+
+    return mtimes
+
+
+def _load_index(root: Path, patterns: list[str], exclude: list[str]) -> list[Path] | None:
+    try:
+        with (root / STATE_DIRECTORY / WORKSPACE_INDEX_FILE).open("r") as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(index, dict) or index.get("members") != patterns or index.get("exclude") != exclude:
+        return None
+
+    mtimes = index.get("mtimes", {})
+
+    if _mtimes({Path(directory) for directory in mtimes}) != mtimes:
+        return None
+
+    return [root / member for member in index.get("projects", [])]
+
+
+def _save_index(root: Path, patterns: list[str], exclude: list[str], matched: set[Path], members: list[Path]) -> None:
+    try:
+        (root / STATE_DIRECTORY).mkdir(exist_ok=True)
+    except OSError:
+        return
+
+    index = {
+        "members": patterns,
+        "exclude": exclude,
+        "mtimes": _mtimes(_watched_directories(root, patterns, matched)),
+        "projects": [str(member.relative_to(root)) for member in members],
+    }
+
+    with contextlib.suppress(OSError):
+        (root / STATE_DIRECTORY / WORKSPACE_INDEX_FILE).write_text(json.dumps(index, indent=2))
+
+
+def discover_members(config: Config) -> list[Path]:
+    if config.workspace is None or config.root is None:
+        raise FonkConfigurationError("No workspace members configured")
+
+    root = config.root
+    patterns = config.workspace.members
+    exclude = config.workspace.exclude
+
+    if (members := _load_index(root, patterns, exclude)) is not None:
+        return members
+
+    excluded = _glob_directories(root, exclude)
+    matched = _glob_directories(root, patterns)
+    members = sorted(
+        path
+        for path in matched
+        if path not in excluded and path.resolve() != root.resolve() and (path / "pyproject.toml").is_file()
+    )
+
+    _save_index(root, patterns, exclude, matched, members)
+    return members
+
+
+def load_members(config: Config) -> dict[str, tuple[Path, Config]]:
+    members = {}
+
+    for member in discover_members(config):
+        name = str(member.relative_to(config.root))  # type: ignore
+
+        try:
+            members[name] = (member, get_config(member))
+        except FonkConfigurationError as e:
+            raise FonkConfigurationError(f"{name}: {e}")
+
+    return members
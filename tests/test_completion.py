@@ -0,0 +1,106 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from fonk.completion import complete, load_index
+
+PYPROJECT = """\
+[project]
+name = "demo"
+
+[tool.fonk]
+flags = [
+    { name = "fix", shorthand = "f", description = "Apply fixes" },
+    { name = "config", type = "file" },
+    { name = "out", shorthand = "o", type = "directory" },
+]
+
+[tool.fonk.command.lint]
+type = "shell"
+arguments = ["ruff", "check"]
+description = "Lint the code"
+
+[tool.fonk.command."docs:build"]
+type = "shell"
+arguments = ["mkdocs", "build"]
+
+[tool.fonk.alias.all]
+commands = ["lint", "docs:build"]
+description = "Everything"
+"""
+
+
+@pytest.fixture
+def pyproject(tmp_path):
+    path = tmp_path / "pyproject.toml"
+    path.write_text(PYPROJECT)
+    return path
+
+
+def test_complete_commands_and_aliases(pyproject):
+    index = load_index(pyproject)
+
+    assert complete(index, "bash", "", "fonk") == ["lint", "docs:build", "all"]
+    assert complete(index, "bash", "l", "fonk") == ["lint"]
+    assert complete(index, "fish", "a", "fonk") == ["all\tEverything"]
+
+
+def test_complete_flags(pyproject):
+    index = load_index(pyproject)
+
+    assert complete(index, "bash", "--f", "lint") == ["--fix", "--fail-quick", "--failed"]
+    assert "-f" in complete(index, "bash", "-", "lint")
+    assert complete(index, "bash", "-", "lint") == complete(index, "bash", "-", "")
+    assert complete(index, "bash", "l", "fonk") == ["lint"]
+
+
+def test_complete_escapes_zsh_separators(pyproject):
+    index = load_index(pyproject)
+
+    assert complete(index, "zsh", "", "fonk") == ["lint:Lint the code", "docs\\:build", "all:Everything"]
+    assert complete(index, "zsh", "--fi", "fonk") == ["--fix:Apply fixes"]
+
+
+@pytest.mark.parametrize(
+    ("previous", "expected"),
+    [("--config", ["__file__"]), ("--out", ["__directory__"]), ("-o", ["__directory__"]), ("--fix", ["lint"])],
+)
+def test_complete_hands_paths_to_the_shell(pyproject, previous, expected):
+    assert complete(load_index(pyproject), "bash", "l", previous) == expected
+
+
+def test_load_index_reuses_the_cache(pyproject):
+    load_index(pyproject)
+    path = pyproject.parent / ".fonk" / "completion.json"
+    index = json.loads(path.read_text())
+    index["commands"] = {"cached": ""}
+    path.write_text(json.dumps(index))
+
+    assert load_index(pyproject)["commands"] == {"cached": ""}
+
+
+def test_load_index_rebuilds_when_pyproject_changes(pyproject):
+    assert "test" not in load_index(pyproject)["commands"]
+
+    pyproject.write_text(PYPROJECT + '\n[tool.fonk.command.test]\ntype = "shell"\narguments = ["pytest"]\n')
+
+    assert "test" in load_index(pyproject)["commands"]
+    assert "test" in json.loads((pyproject.parent / ".fonk" / "completion.json").read_text())["commands"]
+
+
+def test_cached_completion_only_imports_the_standard_library(pyproject):
+    load_index(pyproject)
+    script = (
+        "import sys\n"
+        "from fonk.completion import main\n"
+        "main(['bash', 'l', 'fonk'])\n"
+        "print(sorted(name for name in ('rich', 'tomli', 'fonk.config') if name in sys.modules))\n"
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=pyproject.parent, capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.splitlines() == ["lint", "[]"]
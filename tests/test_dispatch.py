@@ -0,0 +1,178 @@
+import pytest
+
+from fonk.config import Config, Flag, OptionInstance
+from fonk.runner import _apply_add_flags, _command_runner_prefix, command_mods_stages
+from fonk.session import gather_commands_deduped
+
+CONFIG = {
+    "flags": [
+        {"name": "fix"},
+        {"name": "strict"},
+        {"name": "level", "type": "int", "default": "3"},
+        {"name": "out", "type": "str", "default": None},
+    ],
+    "command": {
+        "lint": {
+            "type": "uvx",
+            "arguments": ["ruff", "check", "--diff", "src"],
+            "flags": [
+                {"on": "fix", "add": "--fix", "remove": "--diff"},
+                {"on": "strict", "add": ["--select", "ALL"]},
+                {"on": "quiet", "add": "--quiet"},
+            ],
+        },
+        "test": {
+            "type": "uv",
+            "arguments": ["pytest", "tests", "--verbose"],
+            "flags": [
+                {"on": "level", "add": ["--level", "{arg}"], "remove": ["--verbose"]},
+                {"on": "out", "add": "--junit={arg}"},
+                {"on": "fail-quick", "add": "-x"},
+            ],
+        },
+        "docs": {"type": "shell", "arguments": ["mkdocs", "build"], "flags": [{"on": "strict", "add": "--strict"}]},
+    },
+    "alias": {
+        "check": {"commands": ["lint", "test"], "flags": ["strict"]},
+        "fix": {"commands": ["lint", "check"], "flags": ["fix"]},
+        "all": {"commands": ["check", "docs", "lint"]},
+        "deep": {"commands": ["fix", "all"], "flags": ["level"]},
+    },
+}
+
+
+# The set based implementation that FlagSet replaced, kept here as the reference behaviour. Active flags are
+# applied in config order, which is what the bitmask iterates in (a plain set iterates in hash order).
+def _reference_gather(config, runnable, flags):
+    if alias := config.aliases.get(runnable):
+        mods = flags.union(flag for flag in config.flags if flag.name in alias.flags)
+        return [pair for name in alias.commands for pair in _reference_gather(config, name, mods)]
+
+    return [(config.commands[runnable], flags)]
+
+
+def _reference_gather_deduped(config, runnables, flags):
+    commands_with_flags = []
+
+    for runnable in runnables:
+        for command, mods in _reference_gather(config, runnable, flags):
+            if (command, mods) not in commands_with_flags:
+                commands_with_flags.append((command, mods))
+
+    return commands_with_flags
+
+
+def _reference_mods_args(config, command, flags):
+    order = [flag.name for flag in config.flags]
+    applied_mods = set()
+    arguments = list(command.arguments)
+
+    for flag in sorted(flags, key=lambda flag: order.index(flag.name)):
+        for apply_flag in command.flags:
+            if apply_flag.on == flag.name:
+                if isinstance(apply_flag.remove, tuple):
+                    arguments = [arg for arg in arguments if arg not in apply_flag.remove]
+                elif isinstance(apply_flag.remove, str):
+                    arguments.remove(apply_flag.remove)
+
+                _apply_add_flags(flag, apply_flag, arguments)
+                applied_mods.add(flag.name)
+
+    return sorted(applied_mods), [_command_runner_prefix(command) + arguments]
+
+
+def _active(config, names, **values):
+    active: set[Flag] = {flag for flag in config.flags if flag.name in names}
+
+    for name, value in values.items():
+        option = next(flag for flag in config.flags if flag.name == name)
+        active.add(OptionInstance(name=option.name, type=option.type, default=option.default, value=value))
+
+    return active
+
+
+def _expanded(config, gathered, reference):
+    if reference:
+        return [(command.name, _reference_mods_args(config, command, mods)) for command, mods in gathered]
+
+    return [(command.name, command_mods_stages(command, mods)) for command, mods in gathered]
+
+
+@pytest.mark.parametrize(
+    ("runnables", "names", "values"),
+    [
+        (["lint"], [], {}),
+        (["lint", "lint", "docs"], ["quiet"], {}),
+        (["check"], [], {}),
+        (["fix", "check", "lint"], ["fail-quick"], {}),
+        (["all", "fix"], ["quiet"], {"out": "report.xml"}),
+        (["check", "test"], [], {"level": "5"}),
+        (["all"], ["fix", "strict", "quiet"], {"level": "1", "out": "junit.xml"}),
+    ],
+)
+def test_dispatch_matches_set_based_reference(runnables, names, values):
+    config = Config.from_dict("demo", CONFIG)
+    active = _active(config, names, **values)
+
+    gathered = gather_commands_deduped(config, runnables, active)
+    reference = _reference_gather_deduped(config, runnables, active)
+
+    assert [(command.name, sorted(flag.name for flag in mods)) for command, mods in gathered] == [
+        (command.name, sorted(flag.name for flag in mods)) for command, mods in reference
+    ]
+    assert _expanded(config, gathered, reference=False) == _expanded(config, reference, reference=True)
+
+
+def _test_stages(config, runnables, active):
+    return [
+        command_mods_stages(command, mods)
+        for command, mods in gather_commands_deduped(config, runnables, active)
+        if command.name == "test"
+    ]
+
+
+def test_alias_option_uses_its_default():
+    config = Config.from_dict("demo", CONFIG)
+
+    # test is reached through both fix and all, with different flags. The set based implementation added the
+    # bare option here and left {arg} in the arguments
+    expected = (["level"], [["uv", "run", "pytest", "tests", "--level", "3"]])
+
+    assert _test_stages(config, ["deep"], set()) == [expected, expected]
+
+
+def test_alias_option_keeps_the_command_line_value():
+    config = Config.from_dict("demo", CONFIG)
+
+    # The set based implementation held both the bare option and the instance, and applied the rule twice
+    expected = (["level"], [["uv", "run", "pytest", "tests", "--level", "5"]])
+
+    assert _test_stages(config, ["deep"], _active(config, [], level="5")) == [expected, expected]
+
+
+def test_option_values_substitute_arg():
+    config = Config.from_dict("demo", CONFIG)
+    [(command, mods)] = gather_commands_deduped(config, ["test"], _active(config, [], level="7", out="r.xml"))
+
+    assert command_mods_stages(command, mods) == (
+        ["level", "out"],
+        [["uv", "run", "pytest", "tests", "--level", "7", "--junit=r.xml"]],
+    )
+
+
+def test_flag_index_is_shared_and_read_only():
+    config = Config.from_dict(
+        "demo",
+        {
+            "flags": [{"name": "fix"}],
+            "command": {
+                "a": {"type": "shell", "arguments": ["a"], "flags": [{"on": "fix", "add": "--fix"}]},
+                "b": {"type": "shell", "arguments": ["b"], "flags": [{"on": "fix", "add": "--fix"}]},
+            },
+        },
+    )
+
+    assert config.commands["a"].flag_index is config.commands["b"].flag_index
+
+    with pytest.raises(TypeError):
+        config.commands["a"].flag_index["fix"] = ()  # type: ignore
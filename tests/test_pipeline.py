@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from fonk.config import Command, Config
+from fonk.errors import FonkConfigurationError
+from fonk.process import pipefail
+from fonk.runner import command_mods_stages, run_command, run_commands_concurrently
+
+
+def _pipeline(stages, flags=()):
+    return Command.from_dict("pipe", {"type": "pipeline", "stages": stages, "flags": list(flags)})
+
+
+@pytest.mark.parametrize("stage", ["1", True, 1.0, -1, 2, None])
+def test_invalid_stage_is_rejected(stage):
+    flag = {"on": "fix", "add": "-x"}
+    if stage is not None:
+        flag["stage"] = stage
+
+    with pytest.raises(FonkConfigurationError, match="valid stage"):
+        _pipeline([["seq", "3"], ["cat"]], [flag])
+
+
+@pytest.mark.parametrize("stages", [["seq 3", "cat"], "seq 3 | cat", [["seq", 3], ["cat"]], [["seq", "3"], []], [None]])
+def test_malformed_stages_are_rejected(stages):
+    with pytest.raises(FonkConfigurationError, match="non-empty lists of string arguments"):
+        _pipeline(stages)
+
+
+def test_stages_only_in_pipelines():
+    with pytest.raises(FonkConfigurationError, match="only be used in pipeline"):
+        Command.from_dict("a", {"type": "shell", "arguments": ["true"], "flags": [{"on": "fix", "stage": 0}]})
+
+
+def test_flags_apply_to_their_stage():
+    config = Config.from_dict(
+        "demo",
+        {
+            "flags": [{"name": "fix"}],
+            "command": {
+                "pipe": {
+                    "type": "pipeline",
+                    "stages": [["seq", "5"], ["grep", "-v", "3"]],
+                    "flags": [{"on": "fix", "stage": 1, "remove": "-v"}],
+                }
+            },
+        },
+    )
+    active = [flag for flag in config.flags if flag.name == "fix"]
+
+    assert command_mods_stages(config.commands["pipe"], config.flag_table(active).flag_set(active)) == (
+        ["fix"],
+        [["seq", "5"], ["grep", "3"]],
+    )
+
+
+def test_pipefail_reports_stages_by_config_index():
+    stages = [["a"], ["b"], ["c"]]
+
+    assert pipefail(stages, [0, 0, 0]) == (0, [])
+    assert pipefail(stages, [3, 0, 0]) == (3, ["stage 0 (a) exited with 3"])
+    assert pipefail(stages, [3, 4, 0]) == (4, ["stage 0 (a) exited with 3", "stage 1 (b) exited with 4"])
+    assert pipefail([["a"]], [2]) == (2, [])
+
+
+def test_pipeline_runs_sequentially(capfd):
+    config = Config.from_dict("demo", {})
+    command = _pipeline([["seq", "1", "5"], ["grep", "-v", "3"], ["wc", "-l"]])
+
+    assert run_command(command, config.flag_table([]).flag_set([]), True, False) == 0
+    assert capfd.readouterr().out.split()[0] == "4"
+
+
+def test_pipeline_runs_concurrently_with_pipefail(capfd):
+    config = Config.from_dict("demo", {})
+    command = _pipeline([["sh", "-c", "echo a; exit 3"], ["sh", "-c", "cat; exit 0"]])
+
+    failed = asyncio.run(run_commands_concurrently([(command, config.flag_table([]).flag_set([]))], True, False))
+
+    assert failed == {"pipe": 3}
+    assert "stage 0 (sh) exited with 3" in capfd.readouterr().out
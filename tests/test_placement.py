@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+from fonk import place
+from fonk.config import Command, Config
+from fonk.errors import FonkCommandError, FonkConfigurationError
+from fonk.process import placement
+from fonk.runner import CpuPool, run_command, run_commands_concurrently
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="CPU affinity is Linux only")
+
+# Reports the nice level and CPUs of a thread the command starts and of a process it starts
+REPORT = """
+import os, subprocess, sys, threading
+def report():
+    print("thread", os.getpriority(os.PRIO_PROCESS, threading.get_native_id()), sorted(os.sched_getaffinity(0)))
+thread = threading.Thread(target=report)
+thread.start()
+thread.join()
+code = "import os; print('child', os.nice(0), sorted(os.sched_getaffinity(0)))"
+subprocess.run([sys.executable, "-c", code], check=True)
+"""
+
+
+def _command(priority):
+    return Command.from_dict(
+        "report", {"type": "shell", "arguments": [sys.executable, "-c", REPORT], "priority": priority}
+    )
+
+
+def _no_flags():
+    return Config.from_dict("demo", {}).flag_table([]).flag_set([])
+
+
+def _expected(priority, cpus):
+    nice = os.nice(0) + priority
+    return f"thread {nice} {cpus}\nchild {nice} {cpus}"
+
+
+@pytest.fixture
+def eight_cpus(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)))
+
+
+def test_cpu_pool_partitions_cpus(eight_cpus):
+    pool = CpuPool(2, pin=True)
+
+    assert pool.reserved == [0, 1]
+
+    with pool.allocate(None, 3) as first, pool.allocate(4, 3) as second, pool.allocate(None, 3) as third:
+        assert first == {2, 3}
+        assert second == {4, 5, 6, 7}
+        # Every CPU is taken: later commands share all of them instead of waiting
+        assert third == {2, 3, 4, 5, 6, 7}
+
+    assert pool.free == [2, 3, 4, 5, 6, 7]
+
+
+def test_cpu_pool_without_pinning_only_reserves(eight_cpus):
+    pool = CpuPool(1)
+
+    with pool.allocate(2, 2) as cpus:
+        assert cpus == set(range(1, 8))
+
+
+def test_cpu_pool_cannot_reserve_every_cpu(eight_cpus):
+    with pytest.raises(FonkCommandError, match="Cannot reserve 8"):
+        CpuPool(8)
+
+
+def test_placement_prefix():
+    assert placement(None, None) == []
+    assert placement(set(), None) == []
+    assert placement({3, 1}, 5)[-5:] == ["--priority", "5", "--cpus", "1,3", "--"]
+
+
+@pytest.mark.parametrize(
+    ("key", "value"),
+    [("priority", True), ("priority", 20), ("priority", "5"), ("parallelism", True), ("parallelism", 0)],
+)
+def test_invalid_priority_and_parallelism_are_rejected(key, value):
+    with pytest.raises(FonkConfigurationError):
+        Command.from_dict("a", {"type": "shell", "arguments": ["true"], key: value})
+
+
+def test_sequential_command_threads_and_children_inherit_placement(capfd):
+    cpus = sorted(os.sched_getaffinity(0))
+
+    assert run_command(_command(3), _no_flags(), True, False, cpu_pool=CpuPool(0)) == 0
+    assert _expected(3, cpus) in capfd.readouterr().out
+
+
+def test_concurrent_command_threads_and_children_inherit_placement(capfd):
+    pool = CpuPool(0, pin=True)
+
+    failed = asyncio.run(
+        run_commands_concurrently([(_command(4), _no_flags())], False, False, limit_concurrency=1, cpu_pool=pool)
+    )
+
+    assert failed == {}
+    # With a single slot the command gets every CPU
+    assert _expected(4, pool.cpus) in capfd.readouterr().out
+
+
+def test_place_reports_what_it_could_not_apply(monkeypatch, capsys):
+    def refuse(*args):
+        raise PermissionError(1, "Operation not permitted")
+
+    executed = []
+    monkeypatch.setattr(os, "setpriority", refuse)
+    monkeypatch.setattr(os, "sched_setaffinity", refuse)
+    monkeypatch.setattr(os, "execvp", lambda file, args: executed.append(args))
+
+    place.main(["--priority", "-5", "--cpus", "0", "--", "pytest", "-x"])
+
+    assert executed == [["pytest", "-x"]]
+    stderr = capsys.readouterr().err
+    assert "Could not set the nice level of pytest to -5: Operation not permitted" in stderr
+    assert "Could not pin pytest to CPUs [0]: Operation not permitted" in stderr
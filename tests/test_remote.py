@@ -0,0 +1,217 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+
+from fonk.config import get_config
+from fonk.errors import FonkCommandError
+from fonk.remote import RemoteExecutor, Worker, pyproject_digest
+from fonk.runner import Executor, LocalExecutor, _slot_pool, command_mods_stages, run_commands_concurrently
+
+TOKEN = "secret"
+
+PYPROJECT = """\
+[project]
+name = "demo"
+
+[tool.fonk]
+flags = [{name = "loud"}]
+
+[tool.fonk.command.greet]
+type = "shell"
+arguments = ["sh", "-c", "echo hello $0; echo oops >&2; exit 3", "worker"]
+flags = [{on = "loud", remove = "worker", add = "WORKER"}]
+
+[tool.fonk.command.hang]
+type = "shell"
+arguments = ["sleep", "30"]
+timeout = 0.5
+"""
+
+
+@asynccontextmanager
+async def _worker(root: Path):
+    worker = Worker(root, TOKEN, 2)
+    server = await asyncio.start_server(worker.handle, "127.0.0.1", 0)
+
+    try:
+        yield f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    return tmp_path
+
+
+def test_worker_refuses_bad_token(root):
+    async def main():
+        async with _worker(root) as address:
+            await RemoteExecutor.register(address, "wrong", pyproject_digest(root))
+
+    with pytest.raises(FonkCommandError, match="invalid token"):
+        asyncio.run(main())
+
+
+def test_worker_refuses_checkout_out_of_sync(root):
+    async def main():
+        async with _worker(root) as address:
+            await RemoteExecutor.register(address, TOKEN, "0" * 64)
+
+    with pytest.raises(FonkCommandError, match="not in sync"):
+        asyncio.run(main())
+
+
+@pytest.mark.parametrize("reply", [b"{}\n", b'{"jobs": null}\n', b"[]\n", b"3\n"])
+def test_register_rejects_malformed_replies(reply):
+    async def reply_once(reader, writer):
+        await reader.readline()
+        writer.write(reply)
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(reply_once, "127.0.0.1", 0)
+        try:
+            await RemoteExecutor.register(f"127.0.0.1:{server.sockets[0].getsockname()[1]}", TOKEN, "0" * 64)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    with pytest.raises(FonkCommandError, match="Could not register worker"):
+        asyncio.run(main())
+
+
+@pytest.mark.parametrize("message", [[], "greet", {"command": ["greet"]}])
+def test_worker_answers_malformed_requests_with_an_error(root, message):
+    if isinstance(message, dict):
+        message = {"token": TOKEN, "pyproject": pyproject_digest(root), **message}
+
+    async def main():
+        async with _worker(root) as address:
+            host, port = address.rsplit(":", 1)
+            reader, writer = await asyncio.open_connection(host, int(port))
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+            reply = await reader.readline()
+            writer.close()
+            return json.loads(reply)
+
+    assert "error" in asyncio.run(main())
+
+
+def test_worker_streams_output_and_returncode(root):
+    config = get_config(root)
+    command = config.commands["greet"]
+    active = [flag for flag in config.flags if flag.name == "loud"]
+    flags = config.flag_table(active).flag_set(active)
+
+    async def main():
+        async with _worker(root) as address:
+            executor = await RemoteExecutor.register(address, TOKEN, pyproject_digest(root))
+            _, stages = command_mods_stages(command, flags)
+            return executor.slots, await executor.execute(command, flags, stages, None, None)
+
+    slots, (stdout, stderr, returncode) = asyncio.run(main())
+
+    assert slots == 2
+    assert stdout == b"hello WORKER\n"
+    assert stderr == b"oops\n"
+    assert returncode == 3
+
+
+def test_worker_enforces_timeout(root):
+    config = get_config(root)
+    command = config.commands["hang"]
+    flags = config.flag_table([]).flag_set([])
+
+    async def main():
+        async with _worker(root) as address:
+            executor = await RemoteExecutor.register(address, TOKEN, pyproject_digest(root))
+            return await executor.execute(command, flags, [["sleep", "30"]], None, 0.5)
+
+    assert asyncio.run(main()) == (b"", b"", None)
+
+
+def test_workers_get_work_without_a_local_limit(root):
+    config = get_config(root)
+    active = [flag for flag in config.flags if flag.name == "loud"]
+    table = config.flag_table(active)
+    runs = [(config.commands["greet"], table.flag_set([])), (config.commands["greet"], table.flag_set(active))]
+    ran_on = []
+
+    class RecordingExecutor(RemoteExecutor):
+        async def execute(self, command, flags, stages, cwd, timeout):
+            ran_on.append(self.name)
+            return await super().execute(command, flags, stages, cwd, timeout)
+
+    async def main():
+        async with _worker(root) as address:
+            executor = await RecordingExecutor.register(address, TOKEN, pyproject_digest(root))
+            return await run_commands_concurrently(runs, True, False, remote=[executor])
+
+    assert asyncio.run(main()) == {"greet": 3}
+    assert len(ran_on) == 1
+
+
+def test_verbose_output_names_the_worker_after_the_header(root, capsys):
+    config = get_config(root)
+    active = [flag for flag in config.flags if flag.name == "loud"]
+    table = config.flag_table(active)
+    runs = [(config.commands["greet"], table.flag_set([])), (config.commands["greet"], table.flag_set(active))]
+
+    async def main():
+        async with _worker(root) as address:
+            executor = await RemoteExecutor.register(address, TOKEN, pyproject_digest(root))
+            await run_commands_concurrently(runs, False, True, limit_concurrency=1, remote=[executor])
+            return address
+
+    address = asyncio.run(main())
+    lines = capsys.readouterr().out.splitlines()
+    on_worker = lines.index(f"🔹 on {address}")
+
+    assert lines[on_worker - 1].startswith("🔥 Ran greet")
+    assert lines.count(f"🔹 on {address}") == 1
+
+
+def test_slot_pool_takes_executors_in_turn():
+    local = LocalExecutor(3)
+    remote = LocalExecutor(2)
+    remote.name = "remote"
+    pool = _slot_pool([local, remote])
+
+    assert [pool.get_nowait().name for _ in range(pool.qsize())] == ["local", "remote", "local", "remote", "local"]
+
+
+def test_executor_is_abstract():
+    with pytest.raises(TypeError):
+        Executor()  # type: ignore
+
+
+def test_coordinator_gives_up_on_a_hanging_worker(root, monkeypatch):
+    monkeypatch.setattr("fonk.remote.WORKER_TIMEOUT_MARGIN", 0.2)
+    config = get_config(root)
+    command = config.commands["hang"]
+    flags = config.flag_table([]).flag_set([])
+
+    async def hang(reader, writer):
+        await reader.read()
+
+    async def main():
+        server = await asyncio.start_server(hang, "127.0.0.1", 0)
+        executor = RemoteExecutor(f"127.0.0.1:{server.sockets[0].getsockname()[1]}", TOKEN, "digest", 1)
+
+        try:
+            return await asyncio.wait_for(executor.execute(command, flags, [["sleep", "30"]], None, 0.1), 5)
+        finally:
+            server.close()
+
+    _, stderr, returncode = asyncio.run(main())
+
+    assert returncode is None
+    assert b"did not report back" in stderr
@@ -0,0 +1,168 @@
+import json
+
+import pytest
+
+from fonk.cli import _previous_run
+from fonk.config import Config, OptionInstance
+from fonk.errors import FonkCommandError
+from fonk.session import Session
+from fonk.state import RunState, load_state, save_state, session_flags
+
+
+def _config(tmp_path):
+    return Config.from_dict(
+        "demo",
+        {
+            "flags": [{"name": "fix"}, {"name": "level", "type": "int", "default": "3"}],
+            "command": {
+                "lint": {"type": "shell", "arguments": ["true"], "flags": [{"on": "fix", "add": "--fix"}]},
+                "test": {"type": "shell", "arguments": ["true"], "flags": [{"on": "level", "add": "{arg}"}]},
+                "docs": {"type": "shell", "arguments": ["true"]},
+            },
+            "alias": {"all": {"commands": ["lint", "test", "docs"]}},
+        },
+        root=tmp_path,
+    )
+
+
+def _flags(config, *names):
+    return {flag for flag in config.flags if flag.name in names}
+
+
+def _flag_set(config, *names):
+    flags = _flags(config, *names)
+    return config.flag_table(flags).flag_set(flags)
+
+
+def test_record_keys_on_applied_flags(tmp_path):
+    config = _config(tmp_path)
+    lint = config.commands["lint"]
+    docs = config.commands["docs"]
+    state = RunState(runnables=["all"])
+
+    state.record(lint, _flag_set(config, "fix"), 1)
+    state.record(docs, _flag_set(config, "fix"), 0)
+
+    assert state.has_failed(lint, _flag_set(config, "fix"))
+    assert not state.has_failed(lint, _flag_set(config))
+    # docs does not apply fix, so it does not change the command that ran
+    assert state.has_succeeded(docs, _flag_set(config))
+    assert not state.has_succeeded(lint, _flag_set(config, "fix"))
+
+
+def test_record_replaces_previous_outcome(tmp_path):
+    config = _config(tmp_path)
+    lint = config.commands["lint"]
+    state = RunState(runnables=["lint"])
+
+    state.record(lint, _flag_set(config), 1)
+    state.record(lint, _flag_set(config), 0)
+
+    assert not state.has_failed(lint, _flag_set(config))
+    assert state.has_succeeded(lint, _flag_set(config))
+    assert len(state.failed) == 0
+    assert len(state.succeeded) == 1
+
+
+def test_timed_out_counts_as_failed(tmp_path):
+    config = _config(tmp_path)
+    lint = config.commands["lint"]
+    state = RunState(runnables=["lint"])
+
+    state.record(lint, _flag_set(config), None)
+
+    assert state.has_failed(lint, _flag_set(config))
+
+
+def test_save_load_round_trip(tmp_path):
+    config = _config(tmp_path)
+    state = RunState(runnables=["all"], flags=["fix"])
+    state.record(config.commands["lint"], _flag_set(config, "fix"), 2)
+    state.record(config.commands["docs"], _flag_set(config, "fix"), 0)
+
+    save_state(tmp_path, state)
+
+    assert load_state(tmp_path) == state
+    saved = json.loads((tmp_path / ".fonk" / "state.json").read_text())
+    assert saved["failed"] == [{"command": "lint", "flags": ["fix"], "returncode": 2}]
+    assert saved["succeeded"] == [{"command": "docs", "flags": [], "returncode": 0}]
+
+
+def test_load_state_missing_or_corrupt(tmp_path):
+    assert load_state(None) is None
+    assert load_state(tmp_path) is None
+
+    (tmp_path / ".fonk").mkdir()
+    (tmp_path / ".fonk" / "state.json").write_text("{not json")
+    assert load_state(tmp_path) is None
+
+    (tmp_path / ".fonk" / "state.json").write_text(json.dumps({"failed": []}))
+    assert load_state(tmp_path) is None
+
+
+def test_session_flags_ignore_flags_no_command_applies(tmp_path):
+    config = _config(tmp_path)
+    level = OptionInstance(name="level", type="int", default="3", value="5")
+
+    assert session_flags(config, _flags(config, "fix", "verbose", "failed")) == ["fix"]
+    assert session_flags(config, {level}) == ["level=5"]
+
+
+def _previous(config):
+    previous = RunState(runnables=["all"])
+    previous.record(config.commands["lint"], _flag_set(config), 1)
+    previous.record(config.commands["test"], _flag_set(config), 0)
+    return previous
+
+
+def _pending_names(session, flags):
+    return [command.name for command, _ in session.gather_commands_pending(["all"], flags)]
+
+
+def test_pending_failed_only_reruns_failures(tmp_path):
+    config = _config(tmp_path)
+    session = Session(config, True, False, previous=_previous(config), only_failed=True)
+
+    assert _pending_names(session, set()) == ["lint"]
+    # Skipped successes are carried over so that a later --resume still skips them
+    assert session.state.has_succeeded(config.commands["test"], _flag_set(config))
+
+
+def test_pending_resume_skips_successes(tmp_path):
+    config = _config(tmp_path)
+    session = Session(config, True, False, previous=_previous(config))
+
+    assert _pending_names(session, set()) == ["lint", "docs"]
+
+
+def test_pending_without_previous_runs_everything(tmp_path):
+    config = _config(tmp_path)
+    session = Session(config, True, False)
+
+    assert _pending_names(session, _flags(config, "fix")) == ["lint", "test", "docs"]
+    assert session.state.flags == ["fix"]
+
+
+def test_pending_failed_with_nothing_failed_says_so(tmp_path, capsys):
+    config = _config(tmp_path)
+    previous = RunState(runnables=["all"])
+    previous.record(config.commands["lint"], _flag_set(config), 0)
+    session = Session(config, True, False, previous=previous, only_failed=True)
+
+    assert _pending_names(session, set()) == []
+    assert "nothing to rerun" in capsys.readouterr().out
+
+
+def test_previous_run_must_use_the_same_flags(tmp_path):
+    config = _config(tmp_path)
+    previous = RunState(runnables=["lint"], flags=["fix"])
+    previous.record(config.commands["lint"], _flag_set(config, "fix"), 1)
+    save_state(tmp_path, previous)
+
+    assert _previous_run(config, _flags(config, "fix", "failed"), ["lint"]) == previous
+
+    with pytest.raises(FonkCommandError, match="different flags"):
+        _previous_run(config, _flags(config, "failed"), ["lint"])
+
+    with pytest.raises(FonkCommandError, match="No previous run"):
+        _previous_run(config, _flags(config, "fix", "failed"), ["all"])
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from fonk.cli import _deadline
+from fonk.config import FLAG_DEADLINE, Command, Config, OptionInstance
+from fonk.errors import FonkCommandError, FonkConfigurationError
+from fonk.runner import run_command, run_commands_concurrently
+
+
+def _alive(pid: int) -> bool:
+    try:
+        # A killed grandchild can linger as a zombie until its new parent reaps it
+        return Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+    except OSError:
+        pass
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+
+    return True
+
+
+def _background_command(tmp_path: Path, timeout: float) -> tuple[Config, Command]:
+    pidfile = tmp_path / "grandchild.pid"
+    config = Config.from_dict(
+        "demo",
+        {
+            "command": {
+                "hang": {
+                    "type": "shell",
+                    "arguments": ["sh", "-c", f"sleep 30 & echo $! > {pidfile}; wait"],
+                    "timeout": timeout,
+                }
+            }
+        },
+    )
+    return config, config.commands["hang"]
+
+
+def _grandchild(tmp_path: Path) -> int:
+    return int((tmp_path / "grandchild.pid").read_text())
+
+
+def _assert_killed(pid: int) -> None:
+    end = time.monotonic() + 5
+
+    while _alive(pid) and time.monotonic() < end:
+        time.sleep(0.05)
+
+    assert not _alive(pid)
+
+
+def test_sequential_timeout_kills_background_grandchild(tmp_path):
+    config, command = _background_command(tmp_path, 0.5)
+    start = time.monotonic()
+
+    returncode = run_command(command, config.flag_table([]).flag_set([]), True, False)
+
+    assert returncode is None
+    assert time.monotonic() - start < 10
+    _assert_killed(_grandchild(tmp_path))
+
+
+def test_concurrent_timeout_kills_background_grandchild(tmp_path):
+    config, command = _background_command(tmp_path, 0.5)
+    start = time.monotonic()
+
+    failed = asyncio.run(run_commands_concurrently([(command, config.flag_table([]).flag_set([]))], True, False))
+
+    assert failed == {"hang": None}
+    assert time.monotonic() - start < 10
+    _assert_killed(_grandchild(tmp_path))
+
+
+def test_deadline_caps_the_command_timeout(tmp_path):
+    config, command = _background_command(tmp_path, 30)
+
+    returncode = run_command(command, config.flag_table([]).flag_set([]), True, False, deadline=time.monotonic() + 0.5)
+
+    assert returncode is None
+    _assert_killed(_grandchild(tmp_path))
+
+
+@pytest.mark.parametrize("timeout", [0, -1, True, "10"])
+def test_invalid_timeout_is_rejected(timeout):
+    with pytest.raises(FonkConfigurationError, match="Timeout"):
+        Command.from_dict("test", {"type": "shell", "arguments": ["true"], "timeout": timeout})
+
+
+@pytest.mark.parametrize("value", ["0", "-5", "nan"])
+def test_invalid_deadline_is_rejected(value):
+    deadline = OptionInstance(name=FLAG_DEADLINE.name, type="float", default=None, value=value)
+
+    with pytest.raises(FonkCommandError, match="Deadline"):
+        _deadline({deadline})
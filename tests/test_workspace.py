@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from fonk.cli import _member_flags, run
+from fonk.cli_parser import parse_args
+from fonk.config import get_config
+from fonk.errors import FonkCommandError
+from fonk.runner import command_mods_stages
+from fonk.session import WorkspaceSession
+from fonk.workspace import discover_members, load_members
+
+
+def _project(path, extra=""):
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "pyproject.toml").write_text(f'[project]\nname = "{path.name}"\n{extra}')
+
+
+def test_discover_members(tmp_path):
+    _project(tmp_path, '[tool.fonk.workspace]\nmembers = ["packages/*"]\nexclude = ["packages/legacy"]\n')
+    _project(tmp_path / "packages" / "p1")
+    _project(tmp_path / "packages" / "legacy")
+    (tmp_path / "packages" / "notes").mkdir()
+
+    members = discover_members(get_config(tmp_path))
+
+    assert members == [tmp_path / "packages" / "p1"]
+    assert (tmp_path / ".fonk" / "workspace.json").is_file()
+
+
+def test_discover_members_uses_the_index(tmp_path):
+    _project(tmp_path, '[tool.fonk.workspace]\nmembers = ["packages/*"]\n')
+    _project(tmp_path / "packages" / "p1")
+    config = get_config(tmp_path)
+    discover_members(config)
+
+    index_path = tmp_path / ".fonk" / "workspace.json"
+    index = json.loads(index_path.read_text())
+    index["projects"] = ["packages/cached"]
+    index_path.write_text(json.dumps(index))
+
+    assert discover_members(config) == [tmp_path / "packages" / "cached"]
+
+
+def test_discover_members_notices_new_pyproject(tmp_path):
+    _project(tmp_path, '[tool.fonk.workspace]\nmembers = ["packages/*"]\n')
+    _project(tmp_path / "packages" / "p1")
+    (tmp_path / "packages" / "p2").mkdir()
+    config = get_config(tmp_path)
+
+    assert discover_members(config) == [tmp_path / "packages" / "p1"]
+
+    _project(tmp_path / "packages" / "p2")
+
+    assert discover_members(config) == [tmp_path / "packages" / "p1", tmp_path / "packages" / "p2"]
+
+
+def test_discover_members_notices_new_directory(tmp_path):
+    _project(tmp_path, '[tool.fonk.workspace]\nmembers = ["packages/*/*"]\n')
+    _project(tmp_path / "packages" / "a" / "p1")
+    config = get_config(tmp_path)
+
+    assert discover_members(config) == [tmp_path / "packages" / "a" / "p1"]
+
+    _project(tmp_path / "packages" / "b" / "p2")
+
+    assert discover_members(config) == [tmp_path / "packages" / "a" / "p1", tmp_path / "packages" / "b" / "p2"]
+
+
+@pytest.mark.parametrize(
+    "args", [["--failed"], ["--resume"], ["-x"], ["--failed", "--fail-quick"], ["--workers", "localhost:8765"]]
+)
+def test_workspace_rejects_run_control_flags(tmp_path, args):
+    _project(tmp_path, '[tool.fonk.workspace]\nmembers = ["packages/*"]\n')
+    config = get_config(tmp_path)
+    flags, runnables = parse_args(config, ["-w", *args, "test"])
+
+    with pytest.raises(FonkCommandError, match="cannot be combined with --workspace"):
+        run(config, flags, runnables)
+
+
+def test_workspace_parses_flags_declared_by_members(tmp_path):
+    _project(
+        tmp_path,
+        '[tool.fonk]\nflags = [{ name = "check", shorthand = "k" }]\n[tool.fonk.workspace]\nmembers = ["packages/*"]\n',
+    )
+    _project(
+        tmp_path / "packages" / "p1",
+        '[tool.fonk]\nflags = [{ name = "fix", shorthand = "k" }]\n'
+        '[tool.fonk.command.lint]\ntype = "shell"\narguments = ["ruff"]\nflags = [{ on = "fix", add = "--fix" }]\n',
+    )
+    config = get_config(tmp_path)
+    args = ["-w", "lint", "--fix"]
+
+    assert _member_flags(config, ["lint"]) == []
+    # The member shorthand clashes with the root one, which keeps it
+    shorthand, _ = parse_args(config, ["-w", "lint", "-k"], _member_flags(config, args))
+    assert {flag.name for flag in shorthand} == {"workspace", "check"}
+
+    flags, runnables = parse_args(config, args, _member_flags(config, args))
+    session = WorkspaceSession(load_members(config), True, False)
+    [(command, mods)] = session.gather_commands(runnables, flags)["packages/p1"]
+
+    assert "fix" in {flag.name for flag in flags}
+    assert command_mods_stages(command, mods)[1] == [["ruff", "--fix"]]